@@ -57,5 +57,5 @@ __all__ = [
         "rohdeschwarz"]
 
 from .ivi import *
-from . import *
+ivi.lazy_import(__name__, modules=__all__)
 
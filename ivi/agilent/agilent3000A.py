@@ -26,9 +26,6 @@ THE SOFTWARE.
 
 from .agilent2000A import *
 
-import numpy as np
-import struct
-
 from .. import ivi
 from .. import fgen
 
@@ -78,6 +75,7 @@ class agilent3000A(agilent2000A, fgen.ArbWfm, fgen.ArbFrequency,
         self._arbitrary_waveform_size_max = 8192
         self._arbitrary_waveform_size_min = 2
         self._arbitrary_waveform_quantum = 1
+        self._arbitrary_waveform_sample_format = ('<f4', None)
         
         self._identity_description = "Agilent InfiniiVision 3000A X-series IVI oscilloscope driver"
         self._identity_supported_instrument_models = ['DSOX3012A','DSOX3014A','DSOX3024A',
@@ -155,34 +153,7 @@ class agilent3000A(agilent2000A, fgen.ArbWfm, fgen.ArbFrequency,
         self._output_arbitrary_frequency[index] = value
 
     def _arbitrary_waveform_create_channel_waveform(self, index, data):
-        y = None
-        x = None
-        if type(data) == list and type(data[0]) == float:
-            # list
-            y = array(data)
-        elif type(data) == np.ndarray and len(data.shape) == 1:
-            # 1D array
-            y = data
-        elif type(data) == np.ndarray and len(data.shape) == 2 and data.shape[0] == 1:
-            # 2D array, hieght 1
-            y = data[0]
-        elif type(data) == np.ndarray and len(data.shape) == 2 and data.shape[1] == 1:
-            # 2D array, width 1
-            y = data[:,0]
-        else:
-            x, y = ivi.get_sig(data)
-
-        if len(y) % self._arbitrary_waveform_quantum != 0:
-            raise ivi.ValueNotSupportedException()
-
-        raw_data = b''
-
-        for f in y:
-            # clip at -1 and 1
-            if f > 1.0: f = 1.0
-            if f < -1.0: f = -1.0
-
-            raw_data = raw_data + struct.pack('<f', f)
+        x, raw_data = self._arbitrary_waveform_encode(data)
 
         self._write_ieee_block(raw_data, ':%s:arbitrary:data ' % self._output_name[index])
 
@@ -27,8 +27,9 @@ THE SOFTWARE.
 from .agilent34401A import *
 from .. import ivi
 from .. import extra
+from .. import scpi
 
-class agilent34461A(agilent34401A, extra.common.Title):
+class agilent34461A(scpi.common.DataFormat, agilent34401A, extra.common.Title):
     "Agilent 34461A IVI DMM driver"
     
     def __init__(self, *args, **kwargs):
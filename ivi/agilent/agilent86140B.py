@@ -27,7 +27,9 @@ THE SOFTWARE.
 from .. import ivi
 from .. import extra
 from .. import scpi
+from .. import specan
 import time
+import numpy as np
 
 AmplitudeUnitsMapping = {'dBm' : 'dbm',
                          'watt' : 'w'}
@@ -50,7 +52,7 @@ class agilent86140B(ivi.Driver, extra.common.Screenshot, scpi.common.Memory):
         
         self._memory_size = 10
         
-        self._trace_count = 1
+        self._trace_count = 6
         
         self._level_amplitude_units = 'dBm'
         self._acquisition_detector_type = 'sample'
@@ -66,6 +68,7 @@ class agilent86140B(ivi.Driver, extra.common.Screenshot, scpi.common.Memory):
         self._acquisition_sweep_mode_continuous = True
         self._sweep_coupling_sweep_time = 1e-1
         self._sweep_coupling_sweep_time_auto = False
+        self._trace_points = 1001
         self._trace_name = list()
         self._trace_type = list()
         self._acquisition_vertical_scale = 'logarithmic'
@@ -331,6 +334,37 @@ class agilent86140B(ivi.Driver, extra.common.Screenshot, scpi.common.Memory):
                        Error Query function at the conclusion of the sequence to check the
                        instrument status.
                        """)
+        self._add_method('traces[].fetch_x',
+                       self._trace_fetch_x,
+                       """
+                       This function returns the wavelength of each point of the trace, computed
+                       from the start wavelength, the stop wavelength and the number of trace
+                       points. The array has the same length as the amplitude array returned by
+                       the Fetch Y Trace function.
+                       """)
+        self._add_method('traces[].fetch_trace',
+                       self._trace_fetch_trace,
+                       """
+                       This function returns the trace as a specan.Trace holding the amplitude
+                       array of Fetch Y Trace together with the wavelength of each point.
+                       Preconditions are the same as for the Fetch Y Trace function.
+                       
+                       Peak search, next peak, delta marker and band power queries on the
+                       returned trace are computed on the host without further instrument I/O.
+                       """)
+        self._add_method('acquisition.fetch_traces',
+                       self._acquisition_fetch_traces,
+                       """
+                       This function returns several traces the spectrum analyzer acquired in a
+                       single call. Preconditions are the same as for the Fetch Y Trace
+                       function.
+                       
+                       traces is a list of trace names or indices and defaults to the traces
+                       that are switched on. The result is a 2-D array with one row of
+                       amplitudes per trace in the order requested; traces of different lengths
+                       raise Unexpected Response. The data format is set and all traces are
+                       queried in a single program message.
+                       """)
         self._add_method('acquisition.initiate',
                        self._acquisition_initiate,
                        """
@@ -735,17 +769,40 @@ class agilent86140B(ivi.Driver, extra.common.Screenshot, scpi.common.Memory):
         name = self._trace_name[index]
         
         if self._driver_operation_simulate:
-            return list()
+            return np.zeros(0)
         
-        self._write('format:data ascii')
-        l = self._ask('trace:data:y? %s' % name)
+        return self._ask_for_values('format:data real,32;:trace:data:y? %s' % name, format='real,32')
+    
+    def _trace_fetch_trace(self, index):
+        y = self._trace_fetch_y(index)
+        x = np.linspace(self._get_wavelength_start(), self._get_wavelength_stop(), len(y))
+        return specan.Trace(x, y)
+    
+    def _acquisition_fetch_traces(self, traces=None):
+        if traces is None:
+            traces = self._trace_name
+            if not self._driver_operation_simulate:
+                # blank traces hold no data
+                states = self._ask_multiple(['trace:state? %s' % n for n in traces], int)
+                traces = [n for n, s in zip(traces, states) if s]
+        names = [self._trace_name[ivi.get_index(self._trace_name, t)] for t in traces]
         
-        data = list()
-        
-        for p in l.split(','):
-            data.append(float(p))
+        if self._driver_operation_simulate:
+            return np.zeros((len(names), 0))
         
-        return data
+        l = self._ask_multiple(['format:data real,32'] + ['trace:data:y? %s' % n for n in names],
+                lambda b: ivi.decode_binary_values(b, 'real,32'))
+        return specan.stack_traces(l)
+    
+    def _get_trace_points(self):
+        if not self._driver_operation_simulate and not self._get_cache_valid():
+            self._trace_points = int(float(self._ask("sense:sweep:points?")))
+            self._set_cache_valid()
+        return self._trace_points
+    
+    def _trace_fetch_x(self, index):
+        index = ivi.get_index(self._trace_name, index)
+        return np.linspace(self._get_wavelength_start(), self._get_wavelength_stop(), self._get_trace_points())
     
     def _acquisition_initiate(self):
         if not self._driver_operation_simulate:
@@ -28,6 +28,8 @@ import io
 import time
 import struct
 
+import numpy as np
+
 from . import hprtl
 
 from .. import ivi
@@ -59,6 +61,7 @@ class agilentBase8590(ivi.Driver, specan.Base,
         super(agilentBase8590, self).__init__(*args, **kwargs)
         
         self._trace_count = 3
+        self._trace_points = 401
 
         self._memory_size = 9
         
@@ -105,6 +108,14 @@ class agilentBase8590(ivi.Driver, specan.Base,
                         or an empty string to clear the advisory line.  
                         """))
 
+        self._add_method('traces[].fetch_x',
+                        self._trace_fetch_x,
+                        ivi.Doc("""
+                        Returns the frequency of each point of the trace, computed from the start
+                        and stop frequencies.  The array has the same length as the array returned
+                        by Fetch Y Trace.
+                        """))
+
         self._add_property('frequency.center',
                         self._get_frequency_center,
                         self._set_frequency_center)
@@ -781,50 +792,64 @@ class agilentBase8590(ivi.Driver, specan.Base,
     def _acquisition_status(self):
         return 'unknown'
     
+    def _trace_read_words(self, index, setup=True):
+        "Read a trace as an A-block of 16 bit words, in display units"
+        cmd = 'tr%c?' % chr(index+ord('a'))
+        if setup:
+            cmd = 'tdf a;mds w;' + cmd
+        self._write(cmd)
+
+        buf = self._read_raw(4)
+        if buf[0:2] != b'#A':
+            return np.zeros(0, '>i2')
+
+        cnt = struct.unpack(">H", buf[2:4])[0]
+        return np.frombuffer(self._read_raw(cnt), '>i2')
+
+    def _trace_scaling(self):
+        "Scale and offset from display units to amplitude"
+        if self._get_acquisition_vertical_scale() == 'logarithmic':
+            return 80/8000.0, self._get_level_reference()-80
+        return self._get_level_reference()/8000.0, 0
+
     def _trace_fetch_y(self, index):
         index = ivi.get_index(self._trace_name, index)
 
         if self._driver_operation_simulate:
-            return list()
+            return np.zeros(0)
 
-        cmd = ''
+        data = self._trace_read_words(index).astype(np.float64)
 
-        if index == 0:
-            cmd = 'tra?'
-        elif index == 1:
-            cmd = 'trb?'
-        elif index == 2:
-            cmd = 'trc?'
-        else:
-            return list()
+        scale, offset = self._trace_scaling()
+        data *= scale
+        if offset:
+            data += offset
 
-        self._write('tdf a')
-        self._write('mds w')
-        self._write(cmd)
+        return data
 
+    def _acquisition_fetch_traces(self, traces=None):
+        if traces is None:
+            traces = self._trace_name
+        indices = [ivi.get_index(self._trace_name, t) for t in traces]
 
-        buf = self._read_raw(4)
-        if buf[0:2] != b'#A':
-            return list()
-
-        cnt = struct.unpack(">H", buf[2:4])[0]
-        buf = self._read_raw(cnt)
-
-        data = list()
+        if self._driver_operation_simulate:
+            return np.zeros((len(indices), 0))
 
-        if self._get_acquisition_vertical_scale() == 'logarithmic':
-            offset = self._get_level_reference()-80
-            scale = 80
-        else:
-            offset = 0
-            scale = self._get_level_reference()
+        # the transfer format only needs to be set up once
+        data = specan.stack_traces([self._trace_read_words(indices[i], i == 0)
+                for i in range(len(indices))])
 
-        for i in range(int(cnt/2)):
-                p = struct.unpack(">h", buf[i*2:i*2+2])[0]
-                data.append((p*scale)/8000+offset)
+        scale, offset = self._trace_scaling()
+        data *= scale
+        if offset:
+            data += offset
 
         return data
 
+    def _trace_fetch_x(self, index):
+        index = ivi.get_index(self._trace_name, index)
+        return np.linspace(self._get_frequency_start(), self._get_frequency_stop(), self._trace_points)
+
     def _acquisition_initiate(self):
         pass
     
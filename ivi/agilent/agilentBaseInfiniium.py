@@ -24,6 +24,8 @@ THE SOFTWARE.
 
 """
 
+import numpy as np
+
 from .agilentBaseScope import *
 
 AcquisitionModeMapping = {
@@ -124,6 +126,18 @@ class agilentBaseInfiniium(agilentBaseScope):
                         * Green minimum value
                         * Green maximum value
                         """))
+        self._add_method('channels[].measurement.fetch_waveform_chunks',
+                        self._measurement_fetch_waveform_chunks,
+                        ivi.Doc("""
+                        Returns an iterator over the waveform the oscilloscope acquired for the
+                        specified channel.  Each item is a Waveform covering consecutive points of
+                        the record; holes in the record are NaN.
+                        
+                        The record is transferred and converted in blocks of chunk_size bytes
+                        (default 1 MiB), so very deep acquisitions can be written to disk or
+                        reduced while they arrive without holding the whole record in memory.
+                        The iterator must be exhausted before any other instrument I/O.
+                        """))
         
         self._init_channels()
         
@@ -207,49 +221,124 @@ class agilentBaseInfiniium(agilentBaseScope):
         self._channel_input_impedance[index] = value
         self._set_cache_valid(index=index)
     
-    def _measurement_fetch_waveform(self, index):
-        index = ivi.get_index(self._channel_name, index)
-        
-        if self._driver_operation_simulate:
-            return list()
-        
+    def _set_waveform_format(self, value):
+        # records are always transferred as signed words
+        if value != 'word':
+            raise ivi.ValueNotSupportedException()
+        super(agilentBaseInfiniium, self)._set_waveform_format(value)
+    
+    def _set_waveform_points_mode(self, value):
+        # the full acquisition record is always transferred
+        if value != 'normal':
+            raise ivi.ValueNotSupportedException()
+        super(agilentBaseInfiniium, self)._set_waveform_points_mode(value)
+    
+    def _set_waveform_points(self, value):
+        if int(value) != 0:
+            raise ivi.ValueNotSupportedException()
+        super(agilentBaseInfiniium, self)._set_waveform_points(value)
+    
+    def _measurement_fetch_waveform_setup(self):
         if sys.byteorder == 'little':
             self._write(":waveform:byteorder lsbfirst")
         else:
             self._write(":waveform:byteorder msbfirst")
         self._write(":waveform:format word")
-        self._write(":waveform:source %s" % self._channel_name[index])
+    
+    def _measurement_fetch_waveform_parse_preamble(self, data, allow_min_max=False):
+        pre = data.split(',')
+        
+        pre = {
+            'format': int(pre[0]),
+            'type': int(pre[1]),
+            'points': int(pre[2]),
+            'count': int(pre[3]),
+            'x_increment': float(pre[4]),
+            'x_origin': float(pre[5]),
+            'x_reference': int(float(pre[6])),
+            'y_increment': float(pre[7]),
+            'y_origin': float(pre[8]),
+            'y_reference': int(float(pre[9]))}
+        
+        # type 1 is a raw record, peak detect records (type 10) are not
+        # decoded as min/max pairs
+        pre['min_max'] = False
         
-        # Read preamble
+        if pre['format'] != 2:
+            raise ivi.UnexpectedResponseException()
         
-        pre = self._ask(":waveform:preamble?").split(',')
+        return pre
+    
+    def _measurement_fetch_waveform_decode(self, raw_data, pre):
+        # a code of 31232 is a hole in the record
+        y_data = np.frombuffer(raw_data, np.int16, len(raw_data) // 2)[:pre['points']]
         
-        format = int(pre[0])
-        type = int(pre[1])
-        points = int(pre[2])
-        count = int(pre[3])
-        xincrement = float(pre[4])
-        xorigin = float(pre[5])
-        xreference = int(float(pre[6]))
-        yincrement = float(pre[7])
-        yorigin = float(pre[8])
-        yreference = int(float(pre[9]))
+        return ivi.RawWaveform(y_data, pre['y_increment'], pre['y_origin'], pre['y_reference'], 31232,
+                pre['x_increment'], pre['x_origin'], pre['x_reference'], pre)
+    
+    def _measurement_fetch_waveform_min_max(self, index, bins=1000):
+        # checked before the record is transferred
+        if not self._driver_operation_simulate and self._get_acquisition_type() == 'peak_detect':
+            raise scope.InvalidAcquisitionTypeException("Peak detect records are not supported")
+        return super(agilentBaseInfiniium, self)._measurement_fetch_waveform_min_max(index, bins)
+    
+    def _measurement_fetch_waveform_window(self, index, start=None, stop=None, units='points'):
+        index = ivi.get_index(self._channel_name, index)
         
-        #if type == 1:
-        #    raise scope.InvalidAcquisitionTypeException()
+        if self._driver_operation_simulate:
+            return ivi.Waveform([])
         
-        if format != 2:
-            raise UnexpectedResponseException()
+        pre = self._measurement_fetch_waveform_preamble(index)
+        x_origin = pre['x_origin'] - pre['x_reference'] * pre['x_increment']
+        first, last = scope.get_waveform_window(start, stop, units,
+                x_origin, pre['x_increment'], pre['points'])
+        if last == first:
+            return ivi.Waveform(np.zeros(0), x_origin + first * pre['x_increment'], pre['x_increment'], pre)
+        
+        # transfer only the window, the start point is one based
+        raw_data = self._ask_for_ieee_block(":waveform:data? %d,%d" % (first + 1, last - first))
+        
+        raw = self._measurement_fetch_waveform_decode(raw_data, pre)
+        raw.x_origin += first * raw.x_increment
+        return raw.to_waveform()
+    
+    def _measurement_fetch_waveform_chunks(self, index, chunk_size=None):
+        index = ivi.get_index(self._channel_name, index)
+        
+        if self._driver_operation_simulate:
+            return
+        
+        pre = self._measurement_fetch_waveform_preamble(index)
+        
+        # Read and convert waveform data one chunk at a time
+        n = 0
+        for chunk in self._ask_for_ieee_block_chunks(":waveform:data?", chunk_size, 2):
+            y_data = np.frombuffer(chunk, np.int16)[:max(pre['points'] - n, 0)]
+            if len(y_data) == 0:
+                continue
+            yield ivi.RawWaveform(y_data, pre['y_increment'], pre['y_origin'], pre['y_reference'], 31232,
+                    pre['x_increment'], pre['x_origin'], pre['x_reference'] - n, pre).to_waveform()
+            n += len(y_data)
+    
+    def _measurement_fetch_segments(self, index):
+        index = ivi.get_index(self._channel_name, index)
+        
+        if self._driver_operation_simulate:
+            return (ivi.Waveform(np.zeros((0, 0))), np.zeros(0))
         
-        # Read waveform data
-        raw_data = self._ask_for_ieee_block(":waveform:data?")
+        count = self._get_acquisition_segmented_acquired_count()
+        pre = self._measurement_fetch_waveform_preamble(index)
         
-        # Split out points and convert to time and voltage pairs
-        y_data = array.array('h', raw_data[0:points*2])
+        # transfer all segments as one record and all time tags as one list
+        data, time_tags = self._ask_multiple([":waveform:segmented:all on",
+                ":waveform:data?", ":waveform:segmented:xlist? ttag",
+                ":waveform:segmented:all off"])
         
-        data = [(((i - xreference) * xincrement) + xorigin, float('nan') if y == 31232 else ((y - yreference) * yincrement) + yorigin) for i, y in enumerate(y_data)]
+        data = memoryview(data)
+        n = (len(data) // max(count, 1)) & ~1
+        records = [self._measurement_fetch_waveform_decode(data[i*n:(i+1)*n], pre) for i in range(count)]
         
-        return data
+        return (ivi.Waveform.stack(records), ivi.decode_ascii_values(time_tags)[:count])
     
     def _measurement_read_waveform(self, index, maximum_time):
         return self._measurement_fetch_waveform(index)
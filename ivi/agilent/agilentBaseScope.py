@@ -24,10 +24,11 @@ THE SOFTWARE.
 
 """
 
-import array
 import sys
 import time
 
+import numpy as np
+
 from .. import ivi
 from .. import scope
 from .. import scpi
@@ -158,6 +159,13 @@ TimebaseReferenceMapping = {
         'center': 'cent',
         'right': 'righ'}
 TriggerModifierMapping = {'none': 'normal', 'auto': 'auto'}
+WaveformFormatMapping = {
+        'byte': 'byte',
+        'word': 'word'}
+WaveformPointsModeMapping = {
+        'normal': 'normal',
+        'maximum': 'maximum',
+        'raw': 'raw'}
 
 class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.common.Reset,
                        scpi.common.SelfTest, scpi.common.Memory,
@@ -213,6 +221,11 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
         self._display_screenshot_image_format_mapping = ScreenshotImageFormatMapping
         self._display_vectors = True
         self._display_labels = True
+        self._waveform_format = 'word'
+        self._waveform_points_mode = 'normal'
+        self._waveform_points = 0
+        self._waveform_source = None
+        self._waveform_preamble = dict()
         
         self._identity_description = "Agilent generic IVI oscilloscope driver"
         self._identity_identifier = ""
@@ -298,6 +311,17 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
                         Returns the time tag of the currently selected segmented memory index. The
                         index is selected using the acquisition.segmented.index property.
                         """))
+        self._add_method('channels[].measurement.fetch_segments',
+                        self._measurement_fetch_segments,
+                        ivi.Doc("""
+                        Returns all memory segments of a segmented acquisition for the specified
+                        channel.
+                        
+                        The result is a tuple (waveform, time_tags).  waveform is a 2-D
+                        ivi.Waveform with one row per segment, time_tags is an array with the
+                        time tag of each segment.  All segments are requested in a single
+                        program message instead of selecting and fetching them one at a time.
+                        """))
         self._add_property('channels[].bw_limit',
                         self._get_channel_bw_limit,
                         self._set_channel_bw_limit,
@@ -462,6 +486,43 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
                         Writes a string to the advisory line on the instrument display.  Send None
                         or an empty string to clear the advisory line.  
                         """))
+        self._add_property('waveform.format',
+                        self._get_waveform_format,
+                        self._set_waveform_format,
+                        None,
+                        ivi.Doc("""
+                        Selects the sample width used to transfer waveforms.
+                        
+                        Values:
+                        * 'byte': 8 bit samples, half the transfer time of 'word' and
+                          sufficient for 8 bit ADCs
+                        * 'word': 16 bit samples
+                        """))
+        self._add_property('waveform.points_mode',
+                        self._get_waveform_points_mode,
+                        self._set_waveform_points_mode,
+                        None,
+                        ivi.Doc("""
+                        Selects the record that waveforms are transferred from.
+                        
+                        Values:
+                        * 'normal': the measurement record shown on screen
+                        * 'maximum': the raw acquisition record when the acquisition is
+                          stopped, otherwise the measurement record
+                        * 'raw': the raw acquisition record, requires the acquisition to be
+                          stopped
+                        """))
+        self._add_property('waveform.points',
+                        self._get_waveform_points,
+                        self._set_waveform_points,
+                        None,
+                        ivi.Doc("""
+                        Number of points to transfer.  When set to 0, all points available in the
+                        selected record are transferred.
+                        """))
+        
+        self._cache_dependents.append((('timebase_', 'channel_', 'acquisition_', 'waveform_transfer'),
+                'waveform_preamble'))
         
         self._init_channels()
     
@@ -544,6 +605,31 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
         self._channel_count = self._analog_channel_count + self._digital_channel_count
         self.channels._set_list(self._channel_name)
     
+    def _load_channel_settings(self):
+        "Read range, offset and coupling of all analog channels in one transaction"
+        # called on the first cache miss after initialize, load_setup or
+        # invalidate_all_attributes, so later reads are served from the cache
+        if self._driver_operation_simulate or not self._driver_operation_cache:
+            return
+        
+        queries = list()
+        for name in self._analog_channel_name:
+            queries.append(":%s:range?" % name)
+            queries.append(":%s:offset?" % name)
+            queries.append(":%s:coupling?" % name)
+        
+        resp = self._ask_multiple(queries)
+        
+        for i in range(len(self._analog_channel_name)):
+            self._channel_range[i] = float(resp[3*i])
+            self._channel_scale[i] = self._channel_range[i] / self._vertical_divisions
+            self._channel_offset[i] = float(resp[3*i+1])
+            self._channel_coupling[i] = resp[3*i+2].lower()
+            self._set_cache_valid(True, "channel_range", i)
+            self._set_cache_valid(True, "channel_scale", i)
+            self._set_cache_valid(True, "channel_offset", i)
+            self._set_cache_valid(True, "channel_coupling", i)
+    
     def _system_fetch_setup(self):
         if self._driver_operation_simulate:
             return b''
@@ -776,6 +862,34 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
         self._display_labels = value
         self._set_cache_valid()
     
+    def _get_waveform_format(self):
+        return self._waveform_format
+    
+    def _set_waveform_format(self, value):
+        if value not in WaveformFormatMapping:
+            raise ivi.ValueNotSupportedException()
+        self._waveform_format = value
+        self._set_cache_valid(False, 'waveform_transfer')
+    
+    def _get_waveform_points_mode(self):
+        return self._waveform_points_mode
+    
+    def _set_waveform_points_mode(self, value):
+        if value not in WaveformPointsModeMapping:
+            raise ivi.ValueNotSupportedException()
+        self._waveform_points_mode = value
+        self._set_cache_valid(False, 'waveform_transfer')
+    
+    def _get_waveform_points(self):
+        return self._waveform_points
+    
+    def _set_waveform_points(self, value):
+        value = int(value)
+        if value < 0:
+            raise ivi.OutOfRangeException()
+        self._waveform_points = value
+        self._set_cache_valid(False, 'waveform_transfer')
+    
     def _display_clear(self):
         if not self._driver_operation_simulate:
             self._write(":cdisplay")
@@ -963,8 +1077,10 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
     def _get_channel_coupling(self, index):
         index = ivi.get_index(self._analog_channel_name, index)
         if not self._driver_operation_simulate and not self._get_cache_valid(index=index):
-            self._channel_coupling[index] = self._ask(":%s:coupling?" % self._channel_name[index]).lower()
-            self._set_cache_valid(index=index)
+            self._load_channel_settings()
+            if not self._get_cache_valid(index=index):
+                self._channel_coupling[index] = self._ask(":%s:coupling?" % self._channel_name[index]).lower()
+                self._set_cache_valid(index=index)
         return self._channel_coupling[index]
     
     def _set_channel_coupling(self, index, value):
@@ -979,8 +1095,11 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
     def _get_channel_offset(self, index):
         index = ivi.get_index(self._channel_name, index)
         if not self._driver_operation_simulate and not self._get_cache_valid(index=index):
-            self._channel_offset[index] = float(self._ask(":%s:offset?" % self._channel_name[index]))
-            self._set_cache_valid(index=index)
+            if index < self._analog_channel_count:
+                self._load_channel_settings()
+            if not self._get_cache_valid(index=index):
+                self._channel_offset[index] = float(self._ask(":%s:offset?" % self._channel_name[index]))
+                self._set_cache_valid(index=index)
         return self._channel_offset[index]
     
     def _set_channel_offset(self, index, value):
@@ -994,10 +1113,13 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
     def _get_channel_range(self, index):
         index = ivi.get_index(self._channel_name, index)
         if not self._driver_operation_simulate and not self._get_cache_valid(index=index):
-            self._channel_range[index] = float(self._ask(":%s:range?" % self._channel_name[index]))
-            self._channel_scale[index] = self._channel_range[index] / self._vertical_divisions
-            self._set_cache_valid(index=index)
-            self._set_cache_valid(True, "channel_scale", index)
+            if index < self._analog_channel_count:
+                self._load_channel_settings()
+            if not self._get_cache_valid(index=index):
+                self._channel_range[index] = float(self._ask(":%s:range?" % self._channel_name[index]))
+                self._channel_scale[index] = self._channel_range[index] / self._vertical_divisions
+                self._set_cache_valid(index=index)
+                self._set_cache_valid(True, "channel_scale", index)
         return self._channel_range[index]
     
     def _set_channel_range(self, index, value):
@@ -1168,7 +1290,9 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
         self._set_cache_valid()
     
     def _measurement_abort(self):
-        pass
+        if not self._driver_operation_simulate:
+            self._write(":stop")
+            self._set_cache_valid(False, 'trigger_continuous')
     
     def _get_trigger_tv_trigger_event(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
@@ -1330,52 +1454,171 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
     def _set_trigger_ac_line_slope(self, value):
         self._set_trigger_edge_slope(value)
     
-    def _measurement_fetch_waveform(self, index):
-        index = ivi.get_index(self._channel_name, index)
-        
-        if self._driver_operation_simulate:
-            return list()
-        
+    def _measurement_fetch_waveform_setup(self):
         if sys.byteorder == 'little':
             self._write(":waveform:byteorder lsbfirst")
         else:
             self._write(":waveform:byteorder msbfirst")
         self._write(":waveform:unsigned 1")
-        self._write(":waveform:format word")
-        self._write(":waveform:points normal")
-        self._write(":waveform:source %s" % self._channel_name[index])
+        self._write(":waveform:format %s" % WaveformFormatMapping[self._waveform_format])
+        self._write(":waveform:points:mode %s" % WaveformPointsModeMapping[self._waveform_points_mode])
+        if self._waveform_points:
+            self._write(":waveform:points %d" % self._waveform_points)
+        elif self._waveform_points_mode != 'normal':
+            self._write(":waveform:points maximum")
+    
+    def _measurement_fetch_waveform_parse_preamble(self, data, allow_min_max=False):
+        pre = data.split(',')
+        
+        pre = {
+            'format': int(pre[0]),
+            'type': int(pre[1]),
+            'points': int(pre[2]),
+            'count': int(pre[3]),
+            'x_increment': float(pre[4]),
+            'x_origin': float(pre[5]),
+            'x_reference': int(float(pre[6])),
+            'y_increment': float(pre[7]),
+            'y_origin': float(pre[8]),
+            'y_reference': int(float(pre[9]))}
+        
+        # peak detect records hold a minimum and a maximum for every time bucket
+        pre['min_max'] = pre['type'] == 1
+        
+        if pre['min_max'] and not allow_min_max:
+            raise scope.InvalidAcquisitionTypeException()
+        
+        if pre['format'] not in (0, 1):
+            raise ivi.UnexpectedResponseException()
+        
+        return pre
+    
+    def _measurement_fetch_waveform_read_preamble(self):
+        return self._measurement_fetch_waveform_parse_preamble(self._ask(":waveform:preamble?"))
+    
+    def _measurement_fetch_waveform_prepare(self):
+        # transfer setup, source and preambles are cached; preambles are
+        # invalidated by timebase, channel and acquisition changes
+        if not self._get_cache_valid('waveform_transfer'):
+            self._measurement_fetch_waveform_setup()
+            self._set_cache_valid(True, 'waveform_transfer')
+        
+        if not self._get_cache_valid('waveform_preamble'):
+            self._waveform_preamble = dict()
+            self._set_cache_valid(True, 'waveform_preamble')
+    
+    def _measurement_fetch_waveform_preamble(self, index):
+        self._measurement_fetch_waveform_prepare()
+        
+        if not self._get_cache_valid('waveform_source') or self._waveform_source != index:
+            self._write(":waveform:source %s" % self._channel_name[index])
+            self._waveform_source = index
+            self._set_cache_valid(True, 'waveform_source')
         
         # Read preamble
         
-        pre = self._ask(":waveform:preamble?").split(',')
+        pre = self._waveform_preamble.get(index)
+        if pre is None:
+            pre = self._measurement_fetch_waveform_read_preamble()
+            # the maximum record depends on whether the acquisition is stopped
+            if self._waveform_points_mode != 'maximum':
+                self._waveform_preamble[index] = pre
         
-        format = int(pre[0])
-        type = int(pre[1])
-        points = int(pre[2])
-        count = int(pre[3])
-        xincrement = float(pre[4])
-        xorigin = float(pre[5])
-        xreference = int(float(pre[6]))
-        yincrement = float(pre[7])
-        yorigin = float(pre[8])
-        yreference = int(float(pre[9]))
+        return pre
+    
+    def _measurement_fetch_waveform_raw(self, index):
+        index = ivi.get_index(self._channel_name, index)
         
-        if type == 1:
-            raise scope.InvalidAcquisitionTypeException()
+        if self._driver_operation_simulate:
+            return ivi.RawWaveform(np.zeros(0, np.uint8 if self._waveform_format == 'byte' else np.uint16))
         
-        if format != 1:
-            raise UnexpectedResponseException()
+        pre = self._measurement_fetch_waveform_preamble(index)
         
         # Read waveform data
         raw_data = self._ask_for_ieee_block(":waveform:data?")
-        self._read_raw() # flush buffer
         
-        # Split out points and convert to time and voltage pairs
-        y_data = array.array('h', raw_data[0:points*2])
+        return self._measurement_fetch_waveform_decode(raw_data, pre)
+    
+    def _measurement_fetch_waveform_decode(self, raw_data, pre):
+        # preamble format 0 is byte, 1 is word
+        if pre['format'] == 0:
+            dtype = np.dtype(np.uint8)
+        else:
+            dtype = np.dtype(np.uint16)
+        
+        # a code of 0 is a hole in the record
+        y_data = np.frombuffer(raw_data, dtype, len(raw_data) // dtype.itemsize)[:pre['points']]
+        
+        return ivi.RawWaveform(y_data, pre['y_increment'], pre['y_origin'], pre['y_reference'], 0,
+                pre['x_increment'], pre['x_origin'], pre['x_reference'], pre)
+    
+    def _measurement_fetch_waveform(self, index):
+        return self._measurement_fetch_waveform_raw(index).to_waveform()
+    
+    def _measurement_fetch_waveform_window(self, index, start=None, stop=None, units='points'):
+        # :waveform:data? takes no start and size and :waveform:points always
+        # counts from the start of the record, so the whole record is
+        # transferred and sliced here (the Infiniium transfers the window)
+        return super(agilentBaseScope, self)._measurement_fetch_waveform_window(index, start, stop, units)
+    
+    def _measurement_fetch_waveform_records(self, channels):
+        channels = [ivi.get_index(self._channel_name, index) for index in channels]
+        
+        if self._driver_operation_simulate:
+            return [self._measurement_fetch_waveform_raw(index) for index in channels]
+        
+        self._measurement_fetch_waveform_prepare()
         
-        data = [(((i - xreference) * xincrement) + xorigin, float('nan') if y == 0 else ((y - yreference) * yincrement) + yorigin) for i, y in enumerate(y_data)]
+        # switch the source and read preamble and data of every channel in
+        # one program message, preambles are only queried when not cached
+        queries = list()
+        for index in channels:
+            queries.append(":waveform:source %s" % self._channel_name[index])
+            if index not in self._waveform_preamble:
+                queries.append(":waveform:preamble?")
+            queries.append(":waveform:data?")
         
-        return data
+        resp = iter(self._ask_multiple(queries))
+        records = list()
+        for index in channels:
+            pre = self._waveform_preamble.get(index)
+            if pre is None:
+                pre = self._measurement_fetch_waveform_parse_preamble(next(resp))
+                if self._waveform_points_mode != 'maximum':
+                    self._waveform_preamble[index] = pre
+            records.append(self._measurement_fetch_waveform_decode(next(resp), pre))
+        
+        if channels:
+            self._waveform_source = channels[-1]
+            self._set_cache_valid(True, 'waveform_source')
+        
+        return records
+    
+    def _measurement_fetch_segments(self, index):
+        index = ivi.get_index(self._channel_name, index)
+        
+        if self._driver_operation_simulate:
+            return (ivi.Waveform(np.zeros((0, 0))), np.zeros(0))
+        
+        count = self._get_acquisition_segmented_acquired_count()
+        pre = self._measurement_fetch_waveform_preamble(index)
+        
+        # select, read and time tag every segment in one program message
+        queries = list()
+        for i in range(1, count+1):
+            queries.append(":acquire:segmented:index %d" % i)
+            queries.append(":waveform:data?")
+            queries.append(":waveform:segmented:ttag?")
+        resp = self._ask_multiple(queries)
+        
+        if count:
+            self._acquisition_segmented_index = count
+            self._set_cache_valid(True, 'acquisition_segmented_index')
+        
+        records = [self._measurement_fetch_waveform_decode(data, pre) for data in resp[0::2]]
+        time_tags = np.array([float(t) for t in resp[1::2]])
+        
+        return (ivi.Waveform.stack(records), time_tags)
     
     def _measurement_read_waveform(self, index, maximum_time):
         return self._measurement_fetch_waveform(index)
@@ -1386,6 +1629,16 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
             self._write(":digitize")
             self._set_cache_valid(False, 'trigger_continuous')
     
+    def _measurement_stream_initiate(self, channels):
+        if not self._driver_operation_simulate:
+            # only digitize the streamed channels
+            self._write(":digitize %s" % ','.join(self._channel_name[index] for index in channels))
+            self._set_cache_valid(False, 'trigger_continuous')
+    
+    def _measurement_stream_wait(self):
+        if not self._driver_operation_simulate:
+            self._ask("*opc?")
+    
     def _get_reference_level_high(self):
         return self._reference_level_high
     
@@ -1462,10 +1715,30 @@ class agilentBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.comm
     def _set_acquisition_number_of_envelopes(self, value):
         self._acquisition_number_of_envelopes = value
     
-    def _measurement_fetch_waveform_min_max(self, index):
+    def _measurement_fetch_waveform_min_max(self, index, bins=1000):
         index = ivi.get_index(self._channel_name, index)
-        data = list()
-        return data
+        
+        if self._driver_operation_simulate:
+            return ivi.Envelope([], [])
+        
+        self._measurement_fetch_waveform_prepare()
+        
+        # always read the preamble, min/max preambles are not cached
+        pre, raw_data = self._ask_multiple([":waveform:source %s" % self._channel_name[index],
+                ":waveform:preamble?", ":waveform:data?"])
+        self._waveform_source = index
+        self._set_cache_valid(True, 'waveform_source')
+        
+        pre = self._measurement_fetch_waveform_parse_preamble(pre, True)
+        wfm = self._measurement_fetch_waveform_decode(raw_data, pre).to_waveform()
+        
+        if pre['min_max']:
+            y = wfm.y[:len(wfm) & ~1]
+            return ivi.Envelope(np.fmin(y[0::2], y[1::2]), np.fmax(y[0::2], y[1::2]),
+                    wfm.x_origin, wfm.x_increment * 2, pre).envelope(bins)
+        
+        # reduce a normal record on the host
+        return wfm.envelope(bins)
     
     def _measurement_read_waveform_min_max(self, index, maximum_time):
         return self._measurement_fetch_waveform_min_max(index)
@@ -24,7 +24,9 @@ THE SOFTWARE.
 
 """
 
-# Phase shifters
-from .colbyPDL10A import colbyPDL10A
-
+__all__ = [
+        # Phase shifters
+        "colbyPDL10A"]
 
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)
@@ -24,7 +24,9 @@ THE SOFTWARE.
 
 """
 
-# Programmable fiberoptic instrument
-from .diconGP700 import diconGP700
-
+__all__ = [
+        # Programmable fiberoptic instrument
+        "diconGP700"]
 
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)
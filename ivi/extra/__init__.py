@@ -30,5 +30,6 @@ __all__ = [
         # Extra base classes
         "dcpwr"]
 
-from . import *
+from .. import ivi
+ivi.lazy_import(__name__, modules=__all__)
 
@@ -24,6 +24,11 @@ THE SOFTWARE.
 
 """
 
+import collections
+import hashlib
+
+import numpy as np
+
 from . import ivi
 
 # Exceptions
@@ -45,6 +50,65 @@ BinaryAlignment = set(['left', 'right'])
 TerminalConfiguration = set(['single_ended', 'differential'])
 TriggerSlope = set(['positive', 'negative', 'either'])
 
+def get_arbitrary_waveform_data(data):
+    """Split arbitrary waveform data into x and y arrays
+    
+    data is a list of values, a 1-D array, a 2-D array with one row or
+    column, an (x, y) tuple of sequences, a list of (x, y) tuples or a 2-D
+    array with an x and a y row or column.  x is None if data holds no x
+    values.  Arrays are not copied.  Anything else, including a tuple of
+    two samples, raises ValueNotSupportedException."""
+    try:
+        if type(data) is tuple and len(data) == 2:
+            x = np.asarray(data[0])
+            y = np.asarray(data[1])
+            if x.ndim != 1 or y.ndim != 1 or len(x) != len(y):
+                raise ivi.ValueNotSupportedException()
+            return x, y
+        a = np.asarray(data)
+    except ValueError:
+        # ragged sequences
+        raise ivi.ValueNotSupportedException()
+    if a.dtype.kind == 'O':
+        # ragged sequences on older numpy
+        raise ivi.ValueNotSupportedException()
+    if a.ndim == 1:
+        return None, a
+    if a.ndim == 2:
+        if a.shape[0] == 1:
+            return None, a[0]
+        if a.shape[1] == 1:
+            return None, a[:,0]
+        if a.shape[0] == 2:
+            return a[0], a[1]
+        if a.shape[1] == 2:
+            return a[:,0], a[:,1]
+    raise ivi.ValueNotSupportedException()
+
+def encode_arbitrary_waveform(y, dtype='<f4', bits=None):
+    """Encode normalized arbitrary waveform samples for transfer
+    
+    Samples are clipped to [-1, 1].  Floating point types transfer the
+    clipped values, integer types are scaled to bits (default the width of
+    the type): offset binary from 0 to 2**bits - 2 for unsigned types, two's
+    complement from -(2**(bits-1) - 1) for signed ones.  dtype includes the
+    byte order, for example '>u2' or '<f4'.  Returns bytes."""
+    dtype = np.dtype(dtype)
+    y = np.clip(np.asarray(y, np.float64), -1.0, 1.0)
+    if dtype.kind == 'f':
+        return y.astype(dtype).tobytes()
+    if bits is None:
+        bits = dtype.itemsize * 8
+    if dtype.kind == 'u':
+        y += 1.0
+        y *= ((1 << bits) - 2) / 2.0
+    else:
+        y *= (1 << (bits - 1)) - 1
+    # round half up
+    y += 0.5
+    np.floor(y, out=y)
+    return y.astype(dtype).tobytes()
+
 
 class Base(ivi.IviContainer):
     "Base IVI methods for all function generators"
@@ -492,6 +556,10 @@ class ArbWfm(ivi.IviContainer):
         self._arbitrary_waveform_size_max = 0
         self._arbitrary_waveform_size_min = 0
         self._arbitrary_waveform_quantum = 0
+        # numpy type and bit depth of the samples sent to the instrument
+        self._arbitrary_waveform_sample_format = ('<f4', None)
+        # waveforms held by the instrument, key -> handle, least recently used first
+        self._arbitrary_waveform_cache = collections.OrderedDict()
         
         self._add_property('outputs[].arbitrary.gain',
                         self._get_output_arbitrary_gain,
@@ -663,6 +731,83 @@ class ArbWfm(ivi.IviContainer):
     def _arbitrary_waveform_create(self, data):
         return "handle"
     
+    def _arbitrary_waveform_encode(self, data):
+        "Check arbitrary waveform data and encode it in the instrument sample format, returns (x, raw_data)"
+        x, y = get_arbitrary_waveform_data(data)
+        if self._arbitrary_waveform_quantum and len(y) % self._arbitrary_waveform_quantum != 0:
+            raise ivi.ValueNotSupportedException()
+        dtype, bits = self._arbitrary_waveform_sample_format
+        return x, encode_arbitrary_waveform(y, dtype, bits)
+    
+    def _arbitrary_waveform_cache_key(self, raw_data, *args):
+        "Content key for encoded waveform data and any settings stored along with it"
+        h = hashlib.sha1(raw_data)
+        for a in args:
+            h.update(repr(a).encode('utf-8'))
+        return h.hexdigest()
+    
+    def _arbitrary_waveform_cache_get(self, key):
+        "Handle of a waveform already on the instrument, or None"
+        handle = self._arbitrary_waveform_cache.pop(key, None)
+        if handle is not None:
+            self._arbitrary_waveform_cache[key] = handle
+        return handle
+    
+    def _arbitrary_waveform_cache_put(self, key, handle):
+        self._arbitrary_waveform_cache.pop(key, None)
+        self._arbitrary_waveform_cache[key] = handle
+    
+    def _arbitrary_waveform_cache_evict_one(self):
+        "Clear the least recently used waveform, returns False if none can be cleared"
+        for key, handle in list(self._arbitrary_waveform_cache.items()):
+            # leave waveforms that are being generated alone
+            if handle in self._output_arbitrary_waveform:
+                continue
+            self._arbitrary_waveform_clear(handle)
+            self._arbitrary_waveform_cache.pop(key, None)
+            return True
+        return False
+    
+    def _arbitrary_waveform_cache_evict(self, count=None):
+        """
+        Clear least recently used waveforms to make room for one more
+        
+        count is the number of waveforms stored on the instrument, including
+        the ones the driver did not create; it defaults to the number of
+        cached waveforms.
+        """
+        n = self._arbitrary_waveform_number_waveforms_max
+        if not n:
+            return
+        if count is None:
+            count = len(self._arbitrary_waveform_cache)
+        while count >= n and self._arbitrary_waveform_cache_evict_one():
+            count -= 1
+    
+    def _arbitrary_waveform_cache_discard(self, handle):
+        for key, h in list(self._arbitrary_waveform_cache.items()):
+            if h == handle:
+                del self._arbitrary_waveform_cache[key]
+    
+    def _arbitrary_waveform_cache_sync(self, handles):
+        """
+        Match the cache to the driver created waveforms found in the instrument catalog
+        
+        Waveforms the cache does not know, e.g. from an earlier session, are
+        kept under their handle as least recently used entries.  Their content
+        is unknown, so they are not found by key; a driver that names its
+        files after the key can check such a file and put it back under its
+        key.  Eviction can clear them either way.
+        """
+        handles = list(handles)
+        present = set(handles)
+        known = set(self._arbitrary_waveform_cache.values())
+        cache = collections.OrderedDict((h, h) for h in handles if h not in known)
+        for k, h in self._arbitrary_waveform_cache.items():
+            if h in present:
+                cache[k] = h
+        self._arbitrary_waveform_cache = cache
+    
     
 class ArbFrequency(ivi.IviContainer):
     "Extension IVI methods for function generators that can produce arbitrary waveforms with variable rate"
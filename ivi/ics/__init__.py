@@ -24,9 +24,9 @@ THE SOFTWARE.
 
 """
 
-# Ethernet to Modbus bridge
-from .ics8099 import ics8099
-
-
-
+__all__ = [
+        # Ethernet to Modbus bridge
+        "ics8099"]
 
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)
@@ -25,10 +25,14 @@ THE SOFTWARE.
 """
 
 # import libraries
-import inspect
+import contextlib
+import importlib
 import numpy as np
 import re
-from functools import partial
+import sys
+import threading
+import types
+from functools import partial, wraps
 
 # try importing drivers
 # python-vxi11 for LAN instruments
@@ -78,6 +82,50 @@ def set_prefer_pyvisa(value=True):
 from .version import __version__
 version = __version__
 
+class LazyPackage(types.ModuleType):
+    "Package module that keeps lazily loaded driver names bound to the driver class"
+    def __setattr__(self, name, value):
+        # the import system binds every loaded submodule on its parent
+        # package, which would shadow the driver class of the same name
+        if type(value) is types.ModuleType and name in self.__dict__.get('_lazy_drivers', ()):
+            value = getattr(value, name)
+        types.ModuleType.__setattr__(self, name, value)
+
+def lazy_import(name, modules=(), drivers=()):
+    """Load the members of package name on first attribute access
+
+    Names in modules are bound to the submodule of the same name, names in
+    drivers are bound to the class of the same name defined in the submodule
+    of the same name.  Python versions without module __getattr__ support
+    import everything immediately.
+    """
+    pkg = sys.modules[name]
+    modules = frozenset(modules)
+    drivers = frozenset(drivers)
+
+    def load(attr):
+        if attr in drivers:
+            value = getattr(importlib.import_module('.' + attr, name), attr)
+        elif attr in modules:
+            value = importlib.import_module('.' + attr, name)
+        else:
+            raise AttributeError("module '%s' has no attribute '%s'" % (name, attr))
+        setattr(pkg, attr, value)
+        return value
+
+    if sys.version_info < (3, 7):
+        for attr in sorted(modules | drivers):
+            load(attr)
+        return
+
+    def __dir__():
+        return sorted(set(pkg.__dict__) | modules | drivers)
+
+    pkg._lazy_drivers = drivers
+    pkg.__getattr__ = load
+    pkg.__dir__ = __dir__
+    pkg.__class__ = LazyPackage
+
 # Exceptions
 class IviException(Exception): pass
 class IviDriverException(IviException): pass
@@ -128,6 +176,82 @@ def get_index(l, i):
     raise SelectorNameException()
 
 
+def get_cache_tag(name):
+    "Convert a getter or setter name into a cache tag (_get_channel_range -> channel_range)"
+    try:
+        return _cache_tags[name]
+    except KeyError:
+        pass
+    tag = name
+    if tag[0:4] == "_get": tag = tag[4:]
+    if tag[0:4] == "_set": tag = tag[4:]
+    if tag[0:1] == "_": tag = tag[1:]
+    _cache_tags[name] = tag
+    return tag
+
+# memoized cache tags and (tag, index) cache keys, shared by all drivers
+_cache_tags = dict()
+_cache_keys = dict()
+
+
+class _CacheContext(threading.local):
+    "Cache tag of the method running in the current thread"
+    tag = None
+
+
+def _cache_tag_method(f, tag):
+    @wraps(f)
+    def method(self, *args, **kwargs):
+        ctx = self._cache_context
+        prev = ctx.tag
+        ctx.tag = tag
+        try:
+            return f(self, *args, **kwargs)
+        finally:
+            ctx.tag = prev
+    method._cache_tag = tag
+    return method
+
+
+def bind_cache_tags(cls):
+    """Bind implicit cache tags to the methods of a driver class
+    
+    Every method of cls and its bases that calls _get_cache_valid or
+    _set_cache_valid is wrapped once so that calls without a tag use the tag
+    derived from the method name (_get_channel_range -> channel_range).
+    Mixins that are not PropertyCollection subclasses are included.  Driver
+    does this for its class on construction."""
+    for c in cls.__mro__:
+        if c is object or '_cache_tags_bound' in c.__dict__:
+            continue
+        for name, f in list(c.__dict__.items()):
+            if type(f) is not types.FunctionType or name.startswith('__') or hasattr(f, '_cache_tag'):
+                continue
+            names = f.__code__.co_names
+            if '_get_cache_valid' in names or '_set_cache_valid' in names:
+                setattr(c, name, _cache_tag_method(f, get_cache_tag(name)))
+        setattr(c, '_cache_tags_bound', True)
+
+
+def anchor_command(cmd, previous):
+    """Anchor a command at the root when it follows a compound SCPI header
+    
+    previous is the list of commands preceding cmd in the same program
+    message.  In SCPI a header after a semicolon is relative to the path of
+    the last compound header (chan1:offs 0;range 1 sets chan1:range), so
+    such commands get a leading colon.  Common commands (*cls) do not change
+    the path and commands of other dialects (tdf a) are left as they are."""
+    if cmd[:1] in (':', '*'):
+        return cmd
+    for p in reversed(previous):
+        if p[:1] == '*':
+            continue
+        if ':' in p.split(None, 1)[0].lstrip(':'):
+            return ':' + cmd
+        break
+    return cmd
+
+
 def get_index_dict(l):
     """Construct a dict object for faster index lookups"""
     d = {}
@@ -137,81 +261,120 @@ def get_index_dict(l):
     return d
 
 
+_missing = object()
+
+
+class ManagedProperty(object):
+    "Class-level data descriptor that dispatches to the per-instance accessors of a managed property"
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        d = obj.__dict__
+        try:
+            f = d['_props'][self.name][0]
+        except KeyError:
+            # not managed on this instance, behave like a plain attribute
+            try:
+                return d[self.name]
+            except KeyError:
+                raise AttributeError(self.name)
+        if f is None:
+            raise AttributeError("unreadable attribute")
+        return f()
+
+    def __set__(self, obj, value):
+        d = obj.__dict__
+        try:
+            f = d['_props'][self.name][1]
+        except KeyError:
+            if self.name not in d and d.get('_locked', False):
+                raise AttributeError("locked")
+            d[self.name] = value
+            return
+        if f is None:
+            raise AttributeError("can't set attribute")
+        f(value)
+
+    def __delete__(self, obj):
+        d = obj.__dict__
+        try:
+            f = d['_props'][self.name][2]
+        except KeyError:
+            if self.name not in d:
+                if d.get('_locked', False):
+                    raise AttributeError("locked")
+                raise AttributeError(self.name)
+            del d[self.name]
+            return
+        if f is None:
+            raise AttributeError("can't delete attribute")
+        f()
+
+
 class PropertyCollection(object):
     "A building block to create hierarchical trees of methods and properties"
     def __init__(self):
-        d = object.__getattribute__(self, '__dict__')
+        d = self.__dict__
         d.setdefault('_props', dict())
         d.setdefault('_docs', dict())
         d.setdefault('_locked', False)
     
     def _add_property(self, name, fget=None, fset=None, fdel=None, doc=None):
         "Add a managed property"
-        d = object.__getattribute__(self, '__dict__')
+        d = self.__dict__
+        d.setdefault('_props', dict())
+        d.setdefault('_docs', dict())
+        # properties are dispatched by a descriptor on the class so that
+        # attribute access does not need a __getattribute__ override; plain
+        # nodes get a class of their own so descriptors are not shared
+        cls = type(self)
+        if cls is PropertyCollection:
+            cls = self.__class__ = type('PropertyCollection', (PropertyCollection,), {})
+        attr = getattr(cls, name, _missing)
+        if attr is _missing:
+            setattr(cls, name, ManagedProperty(name))
+        elif type(attr) is not ManagedProperty:
+            raise AttributeError("property shadows class attribute")
         d['_props'][name] = (fget, fset, fdel)
         d['_docs'][name] = doc
         d[name] = None
     
     def _add_method(self, name, f=None, doc=None):
         "Add a managed method"
-        d = object.__getattribute__(self, '__dict__')
+        d = self.__dict__
+        d.setdefault('_docs', dict())
         d['_docs'][name] = doc
         d[name] = f
     
     def _del_property(self, name):
         "Remove managed property or method"
-        d = object.__getattribute__(self, '__dict__')
-        del d['_props'][name]
+        d = self.__dict__
+        d['_props'].pop(name, None)
         del d['_docs'][name]
         del d[name]
     
     def _lock(self, lock=True):
         "Set lock state to prevent creation or deletion of unmanaged members"
-        d = object.__getattribute__(self, '__dict__')
-        d['_locked'] = lock
+        self.__dict__['_locked'] = lock
     
     def _unlock(self):
         "Unlock object to allow creation or deletion of unmanaged members, equivalent to _lock(False)"
         self._lock(False)
         
-    def __getattribute__(self, name):
-        if name == '__dict__':
-            return object.__getattribute__(self, name)
-        d = object.__getattribute__(self, '__dict__')
-        d.setdefault('_props', dict())
-        d.setdefault('_locked', False)
-        if name in d['_props']:
-            f = d['_props'][name][0]
-            if f is None:
-                raise AttributeError("unreadable attribute")
-            return f()
-        return object.__getattribute__(self, name)
-        
     def __setattr__(self, name, value):
-        d = object.__getattribute__(self, '__dict__')
-        d.setdefault('_props', dict())
-        d.setdefault('_locked', False)
-        if name in d['_props']:
-            f = d['_props'][name][1]
-            if f is None:
-                raise AttributeError("can't set attribute")
-            f(value)
-            return
-        if name not in d and self._locked:
+        d = self.__dict__
+        if name not in d and d.get('_locked', False):
             raise AttributeError("locked")
         object.__setattr__(self, name, value)
         
     def __delattr__(self, name):
-        d = object.__getattribute__(self, '__dict__')
-        d.setdefault('_props', dict())
-        d.setdefault('_locked', False)
-        if name in d['_props']:
-            f = d['_props'][name][2]
-            if f is None:
-                raise AttributeError("can't delete attribute")
-            f()
-            return
-        if name not in d and self._locked:
+        d = self.__dict__
+        if name not in d and d.get('_locked', False):
             raise AttributeError("locked")
         object.__delattr__(self, name)
         
@@ -224,6 +387,7 @@ class IndexedPropertyCollection(object):
         self._indicies = list()
         self._indicies_dict = dict()
         self._objs = list()
+        self._classes = dict()
     
     def _add_property(self, name, fget=None, fset=None, fdel=None, doc=None, props = None, docs = None):
         "Add a managed property"
@@ -287,9 +451,13 @@ class IndexedPropertyCollection(object):
             del self._props[name]
             del self._docs[name]
     
-    def _build_obj(self, props, docs, i):
+    def _build_obj(self, props, docs, i, path=()):
         "Build a tree of PropertyCollection objects with the proper index associations"
-        obj = PropertyCollection()
+        # the objects for all indices share one generated class per node
+        cls = self._classes.get(path)
+        if cls is None:
+            cls = self._classes[path] = type('PropertyCollection', (PropertyCollection,), {})
+        obj = cls()
         for n in props:
             itm = props[n]
             doc = docs[n]
@@ -301,7 +469,7 @@ class IndexedPropertyCollection(object):
                 if fdel is not None: fdeli = partial(fdel, i)
                 obj._add_property(n, fgeti, fseti, fdeli, doc)
             elif type(itm) == dict:
-                o2 = self._build_obj(itm, doc, i)
+                o2 = self._build_obj(itm, doc, i, path + (n,))
                 obj.__dict__[n] = o2
             elif hasattr(itm, "__call__"):
                 obj._add_method(n, partial(itm, i), doc)
@@ -312,18 +480,26 @@ class IndexedPropertyCollection(object):
         "Set a list of allowable indicies as an associative array"
         self._indicies = list(l)
         self._indicies_dict = get_index_dict(self._indicies)
-        self._objs = list()
-        for i in range(len(self._indicies)):
-            self._objs.append(self._build_obj(self._props, self._docs, i))
+        # index objects are built on first access, see _get_obj
+        self._objs = [None] * len(self._indicies)
+    
+    def _get_obj(self, i):
+        "Get the object for index i, building it on first access"
+        obj = self._objs[i]
+        if obj is None:
+            obj = self._build_obj(self._props, self._docs, i)
+            self._objs[i] = obj
+        return obj
     
     def __getitem__(self, key):
         if type(key) is slice:
-            return self._objs[key]
+            return [self._get_obj(i) for i in range(*key.indices(len(self._objs)))]
         i = get_index(self._indicies_dict, key)
-        return self._objs[i]
+        return self._get_obj(i)
 
     def __iter__(self):
-        return self._objs.__iter__()
+        for i in range(len(self._objs)):
+            yield self._get_obj(i)
     
     def __len__(self):
         return len(self._indicies)
@@ -366,7 +542,17 @@ class IviContainer(PropertyCollection):
                     cur_obj = cur_obj.__dict__[base]
 
         if type(doc) == Doc:
-            doc.name = name
+            # Doc objects are kept once per class and shared by its instances
+            docs = type(self).__dict__.get('_class_docs')
+            if docs is None:
+                docs = dict()
+                setattr(type(self), '_class_docs', docs)
+            key = (name, doc.raw_doc, doc.cls, doc.grp, doc.section)
+            try:
+                doc = docs[key]
+            except KeyError:
+                doc.name = name
+                docs[key] = doc
 
         if cur_obj == self:
             if type(attr) == tuple:
@@ -390,12 +576,27 @@ class IviContainer(PropertyCollection):
 
 class Doc(object):
     "IVI documentation object"
+    __slots__ = ('raw_doc', 'name', 'cls', 'grp', 'section', '_doc')
+
     def __init__(self, doc = '', cls = '', grp = '', section = '', name = ''):
-        self.doc = trim_doc(doc)
+        # trimming is deferred until the documentation is actually requested
+        self.raw_doc = doc
         self.name = name
         self.cls = cls
         self.grp = grp
         self.section = section
+        self._doc = None
+    
+    @property
+    def doc(self):
+        if self._doc is None:
+            self._doc = trim_doc(self.raw_doc)
+        return self._doc
+    
+    @doc.setter
+    def doc(self, value):
+        self.raw_doc = value
+        self._doc = None
     
     def render(self):
         txt = '.. attribute:: ' + self.name + '\n\n'
@@ -428,13 +629,29 @@ def add_group_capability(obj, cap):
     obj._identity_group_capabilities.insert(0, cap)
 
 
-def build_ieee_block(data):
-    "Build IEEE block"
+def build_ieee_block_header(length):
+    "Build IEEE block header for a payload of length bytes"
     # IEEE block binary data is prefixed with #lnnnnnnnn
     # where l is length of n and n is the
     # length of the data
-    # ex: #800002000 prefixes 2000 data bytes
-    return str('#8%08d' % len(data)).encode('utf-8') + data
+    # ex: #42000 prefixes 2000 data bytes
+    n = str(int(length))
+    return str('#%d%s' % (len(n), n)).encode('utf-8')
+
+
+def build_ieee_block(data, prefix=b''):
+    "Build IEEE block"
+    # data can be anything supporting the buffer protocol (bytes, bytearray,
+    # memoryview, numpy array); the prefix, header and payload are joined
+    # with a single copy
+    if isinstance(data, bytes):
+        length = len(data)
+    else:
+        data = memoryview(data)
+        if not data.c_contiguous:
+            data = memoryview(data.tobytes())
+        length = data.nbytes
+    return b''.join([prefix, build_ieee_block_header(length), data])
 
     
 def decode_ieee_block(data):
@@ -464,6 +681,332 @@ def decode_ieee_block(data):
         return data[ind:]
 
 
+_response_special = re.compile(b'[;"\'#]')
+_response_delimiter = re.compile(b'[;\n"\'#]')
+# IEEE block response, optionally preceded by a response header
+_ieee_block_start = re.compile(b'\\s*(?:[:*]?[A-Za-z][\\w:]*\\s+)?#[0-9]')
+
+def split_response(data, sep=b';'):
+    """Split a compound response into the responses to the individual queries
+    
+    Separators inside quoted strings and IEEE blocks are ignored.  An
+    indefinite length block (#0) extends to the end of the data.
+    """
+    fields = list()
+    start = 0
+    ind = 0
+    n = len(data)
+    while True:
+        m = _response_special.search(data, ind)
+        if m is None:
+            break
+        ind = m.start()
+        c = data[ind:ind+1]
+        if c == sep:
+            fields.append(data[start:ind])
+            start = ind + 1
+            ind += 1
+        elif c == b'#':
+            l = data[ind+1:ind+2]
+            if not l.isdigit():
+                ind += 1
+            elif l == b'0':
+                ind = n
+            else:
+                l = int(l)
+                ind += 2 + l + int(data[ind+2:ind+2+l])
+        else:
+            # quoted string, embedded quotes are doubled
+            ind += 1
+            while True:
+                ind = data.find(c, ind)
+                if ind < 0:
+                    ind = n
+                    break
+                ind += 1
+                if data[ind:ind+1] != c:
+                    break
+                ind += 1
+    fields.append(data[start:])
+    return fields
+
+
+# numpy type codes for SCPI binary data formats (FORMat:DATA)
+_binary_value_types = {
+        'real,32': 'f4',
+        'real,64': 'f8',
+        'int,8': 'i1',
+        'int,16': 'i2',
+        'int,32': 'i4',
+        'int,64': 'i8',
+        'uint,8': 'u1',
+        'uint,16': 'u2',
+        'uint,32': 'u4',
+        'uint,64': 'u8'}
+
+def decode_ascii_values(data, delim=',', converter=float):
+    "Decode delimited ASCII values into a numpy array"
+    if len(data.strip()) == 0:
+        return np.array([], dtype=np.float64)
+    if converter is float:
+        # parse directly into a float64 array, fall back on malformed data
+        try:
+            out = np.fromstring(data, dtype=np.float64, sep=delim)
+            if len(out) == data.count(delim) + 1:
+                return out
+        except ValueError:
+            pass
+    return np.array([converter(x) for x in data.split(delim)])
+
+
+def decode_binary_values(data, format='real,64', byteorder='big'):
+    "Decode binary values (e.g. contents of an IEEE block) into a numpy array without copying"
+    try:
+        t = _binary_value_types[format.lower().replace(' ', '')]
+    except KeyError:
+        raise ValueNotSupportedException("Unknown data format '%s'" % format)
+    if byteorder == 'big':
+        t = '>' + t
+    else:
+        t = '<' + t
+    return np.frombuffer(data, dtype=t)
+
+
+def _scale_raw(out, raw, y_increment, y_origin, y_reference, hole):
+    "Scale raw sample codes into the float array out"
+    out[...] = raw
+    if y_reference:
+        out -= y_reference
+    out *= y_increment
+    if y_origin:
+        out += y_origin
+    if hole is not None:
+        out[raw == hole] = np.nan
+
+
+def _reduce_bins(y, bins, func):
+    """Reduce the last axis of y to bins values with the ufunc func
+    
+    Returns the reduced array and the number of samples per bin; the samples
+    that do not fill a whole bin are folded into the last one."""
+    n = y.shape[-1]
+    bins = max(min(bins, n), 1)
+    per = n // bins
+    out = func.reduce(y[..., :bins*per].reshape(y.shape[:-1] + (bins, per)), axis=-1)
+    if n > bins * per:
+        out[..., -1] = func(out[..., -1], func.reduce(y[..., bins*per:], axis=-1))
+    return out, per
+
+
+class Waveform(object):
+    """
+    Uniformly sampled waveform
+    
+    y holds the samples as a numpy array, either one record or a 2-D array
+    with one row per record sharing the same x axis.  The x value (time for
+    oscilloscopes) of sample i is x_origin + i * x_increment; the x axis is
+    only computed when x is accessed.  preamble holds the metadata reported
+    by the instrument.
+    
+    For compatibility with the lists of (x, y) tuples returned by older
+    drivers, iterating over a waveform or indexing it with an integer
+    yields (x, y) pairs, and np.array(waveform) is an N by 2 array.  For
+    2-D waveforms y in each pair holds one value per record and the array
+    has one column per record after the x column.
+    """
+    
+    def __init__(self, y, x_origin=0.0, x_increment=1.0, preamble=None):
+        self.y = np.asarray(y)
+        self.x_origin = x_origin
+        self.x_increment = x_increment
+        self.preamble = preamble if preamble is not None else dict()
+        self._x = None
+    
+    @classmethod
+    def from_raw(cls, raw, y_increment=1.0, y_origin=0.0, y_reference=0, hole=None,
+            x_increment=1.0, x_origin=0.0, x_reference=0, preamble=None, dtype=np.float64):
+        """
+        Scale raw sample codes to a waveform
+        
+        y = (raw - y_reference) * y_increment + y_origin, samples equal to
+        hole become NaN.  Sample i is at x = (i - x_reference) * x_increment
+        + x_origin.
+        """
+        raw = np.asarray(raw)
+        y = np.empty(raw.shape, dtype)
+        _scale_raw(y, raw, y_increment, y_origin, y_reference, hole)
+        return cls(y, x_origin - x_reference * x_increment, x_increment, preamble)
+    
+    @classmethod
+    def stack(cls, records, dtype=np.float64):
+        """
+        Combine single records into one 2-D waveform
+        
+        records are Waveform or RawWaveform objects, raw records are scaled
+        straight into the result.  All records are truncated to the length of
+        the shortest one and share the x axis of the first one.  preamble is
+        the list of the record preambles.
+        """
+        records = list(records)
+        n = min(len(r) for r in records) if records else 0
+        y = np.empty((len(records), n), dtype)
+        for row, r in zip(y, records):
+            if isinstance(r, RawWaveform):
+                _scale_raw(row, r.data[:n], r.y_increment, r.y_origin, r.y_reference, r.hole)
+            else:
+                row[...] = r.y[:n]
+        if not records:
+            return cls(y)
+        return cls(y, records[0].x_origin, records[0].x_increment, [r.preamble for r in records])
+    
+    @property
+    def x(self):
+        if self._x is None:
+            self._x = np.arange(len(self)) * self.x_increment + self.x_origin
+        return self._x
+    
+    def envelope(self, bins):
+        """
+        Reduce the waveform to an Envelope of bins minimum/maximum pairs
+        
+        Holes (NaN) are ignored unless a whole bin is empty.
+        """
+        if len(self) == 0:
+            return Envelope(self.y, self.y, self.x_origin, self.x_increment, self.preamble)
+        y_min, per = _reduce_bins(self.y, bins, np.fmin)
+        y_max, per = _reduce_bins(self.y, bins, np.fmax)
+        return Envelope(y_min, y_max, self.x_origin, self.x_increment * per, self.preamble)
+    
+    def __len__(self):
+        return self.y.shape[-1]
+    
+    def __iter__(self):
+        x0 = self.x_origin
+        dx = self.x_increment
+        for i, v in enumerate(self.y.T.tolist()):
+            yield (x0 + i * dx, v)
+    
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return Waveform(self.y[..., key], self.x_origin + start * self.x_increment,
+                    self.x_increment * step, self.preamble)
+        v = self.y[..., key]
+        return (self.x_origin + (key % len(self)) * self.x_increment, v.tolist())
+    
+    def __array__(self, dtype=None, copy=None):
+        a = np.column_stack((self.x, self.y.T))
+        if dtype is not None:
+            a = a.astype(dtype)
+        return a
+    
+    def __repr__(self):
+        if self.y.ndim > 1:
+            return "Waveform(%d records of %d points, x_origin=%g, x_increment=%g)" % (
+                    len(self.y), len(self), self.x_origin, self.x_increment)
+        return "Waveform(%d points, x_origin=%g, x_increment=%g)" % (len(self), self.x_origin, self.x_increment)
+
+
+class Envelope(object):
+    """
+    Minimum and maximum waveforms
+    
+    y_min and y_max hold the minimum and maximum of each point, for example
+    from a peak detect acquisition or from Waveform.envelope.  Point i is at
+    x = x_origin + i * x_increment.
+    
+    Iterating over an envelope or indexing it with an integer yields
+    (x, y_min, y_max) tuples like the lists returned by older drivers, and
+    np.array(envelope) is an N by 3 array.
+    """
+    
+    def __init__(self, y_min, y_max, x_origin=0.0, x_increment=1.0, preamble=None):
+        self.y_min = np.asarray(y_min)
+        self.y_max = np.asarray(y_max)
+        self.x_origin = x_origin
+        self.x_increment = x_increment
+        self.preamble = preamble if preamble is not None else dict()
+        self._x = None
+    
+    @property
+    def x(self):
+        if self._x is None:
+            self._x = np.arange(len(self)) * self.x_increment + self.x_origin
+        return self._x
+    
+    def envelope(self, bins):
+        "Reduce the envelope to at most bins points"
+        if len(self) <= bins:
+            return self
+        y_min, per = _reduce_bins(self.y_min, bins, np.fmin)
+        y_max, per = _reduce_bins(self.y_max, bins, np.fmax)
+        return Envelope(y_min, y_max, self.x_origin, self.x_increment * per, self.preamble)
+    
+    def __len__(self):
+        return self.y_min.shape[-1]
+    
+    def __iter__(self):
+        x0 = self.x_origin
+        dx = self.x_increment
+        for i, (a, b) in enumerate(zip(self.y_min.T.tolist(), self.y_max.T.tolist())):
+            yield (x0 + i * dx, a, b)
+    
+    def __getitem__(self, key):
+        return (self.x_origin + (key % len(self)) * self.x_increment,
+                self.y_min[..., key].tolist(), self.y_max[..., key].tolist())
+    
+    def __array__(self, dtype=None, copy=None):
+        a = np.column_stack((self.x, self.y_min.T, self.y_max.T))
+        if dtype is not None:
+            a = a.astype(dtype)
+        return a
+    
+    def __repr__(self):
+        return "Envelope(%d points, x_origin=%g, x_increment=%g)" % (len(self), self.x_origin, self.x_increment)
+
+
+class RawWaveform(object):
+    """
+    Waveform as raw sample codes with deferred scaling
+    
+    data holds the codes as transferred by the instrument.  Code c stands
+    for (c - y_reference) * y_increment + y_origin, codes equal to hole mark
+    holes in the record.  Sample i is at x = x_origin + i * x_increment.
+    
+    Use to_waveform to convert the whole record or iter_chunks to convert
+    it a piece at a time.
+    """
+    
+    def __init__(self, data, y_increment=1.0, y_origin=0.0, y_reference=0, hole=None,
+            x_increment=1.0, x_origin=0.0, x_reference=0, preamble=None):
+        self.data = np.asarray(data)
+        self.y_increment = y_increment
+        self.y_origin = y_origin
+        self.y_reference = y_reference
+        self.hole = hole
+        self.x_increment = x_increment
+        self.x_origin = x_origin - x_reference * x_increment
+        self.preamble = preamble if preamble is not None else dict()
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def to_waveform(self, start=0, stop=None, dtype=np.float64):
+        "Convert samples start to stop to a Waveform"
+        start, stop, step = slice(start, stop).indices(len(self.data))
+        return Waveform.from_raw(self.data[start:stop], self.y_increment, self.y_origin,
+                self.y_reference, self.hole, self.x_increment,
+                self.x_origin + start * self.x_increment, 0, self.preamble, dtype)
+    
+    def iter_chunks(self, size, dtype=np.float64):
+        "Iterate over the record as Waveforms of at most size samples"
+        for start in range(0, len(self.data), size):
+            yield self.to_waveform(start, start + size, dtype)
+    
+    def __repr__(self):
+        return "RawWaveform(%d points, %s)" % (len(self.data), self.data.dtype)
+
+
 def get_sig(sig):
     "Parse various signal inputs into x and y components"
     if type(sig) == tuple and len(sig) == 2:
@@ -708,6 +1251,7 @@ class DriverOperation(IviContainer):
         self._driver_operation_record_coercions = False
         self._driver_operation_io_resource_descriptor = ""
         self._driver_operation_simulate = False
+        self._driver_operation_batch_size = 512
         
         self._driver_operation_interchange_warnings = list()
         self._driver_operation_coercion_records = list()
@@ -896,6 +1440,41 @@ class DriverOperation(IviContainer):
                         override both the default value and the value that the user specifies in
                         the IVI configuration store.
                         """)
+        self._add_property('driver_operation.batch_size',
+                        self._get_driver_operation_batch_size,
+                        self._set_driver_operation_batch_size,
+                        None,
+                        """
+                        Maximum length in characters of a program message sent while a batch is
+                        active. Queued commands are sent as soon as adding another command would
+                        exceed this length.
+                        
+                        The default value is 512.
+                        """)
+        self._add_method('driver_operation.batch',
+                        self._driver_operation_batch,
+                        """
+                        Returns a context manager that combines commands sent by the driver into
+                        fewer program messages. While the context is active, commands are queued
+                        instead of being written to the instrument one at a time and are sent as
+                        semicolon-separated compound messages. Queued commands are sent before
+                        any query or raw transfer (a pending batch is prepended to the query
+                        itself where possible), when the batch size is reached, and when the
+                        outermost context exits. Attribute caching works exactly as it does
+                        without batching.
+                        
+                        This reduces the number of I/O transactions needed to configure an
+                        instrument, which matters most on high latency links such as GPIB or
+                        VXI-11 over a WAN. Only use it with instruments that accept SCPI-style
+                        compound commands.
+                        
+                        Example::
+                        
+                            with scope.driver_operation.batch():
+                                for ch in scope.channels:
+                                    ch.range = 1.0
+                                    ch.offset = 0.0
+                        """)
         self._add_method('driver_operation.clear_interchange_warnings',
                         self._driver_operation_clear_interchange_warnings,
                         """
@@ -1062,6 +1641,16 @@ class DriverOperation(IviContainer):
             raise SimulationStateException()
         self._driver_operation_simulate = value
     
+    def _get_driver_operation_batch_size(self):
+        return self._driver_operation_batch_size
+    
+    def _set_driver_operation_batch_size(self, value):
+        self._driver_operation_batch_size = int(value)
+    
+    @contextlib.contextmanager
+    def _driver_operation_batch(self):
+        yield
+    
     def _driver_operation_clear_interchange_warnings(self):
         self._driver_operation_interchange_warnings = list()
     
@@ -1504,6 +2093,17 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
         self._initialized = False
         self.__dict__.setdefault('_instrument_id', '')
         self._cache_valid = dict()
+        self._cache_dependents = list()
+        self._cache_context = _CacheContext()
+        if '_cache_tags_bound' not in type(self).__dict__:
+            bind_cache_tags(type(self))
+        self._write_batch = None
+        self._write_batch_depth = 0
+        self._write_batch_length = 0
+        self._write_batch_flushes = 0
+        self._write_batch_encoding = 'utf-8'
+        self._ieee_block_header_size = 64
+        self._ieee_block_chunk_size = 1 << 20
         
         super(Driver, self).__init__(*args, **kwargs)
         
@@ -1858,26 +2458,22 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
         "Returnes initialization state of driver"
         return self._initialized
     
-    def _get_cache_tag(self, tag=None, skip=1):
-        if tag is None:
-            stack = inspect.stack()
-            start = 0 + skip
-            if len(stack) < start + 1:
-                return ''
-            tag = stack[start][3] 
-        
-        if tag[0:4] == "_get": tag = tag[4:]
-        if tag[0:4] == "_set": tag = tag[4:]
-        if tag[0] == "_": tag = tag[1:]
-        
-        return tag
+    def _get_cache_key(self, tag, index):
+        try:
+            return _cache_keys[(tag, index)]
+        except KeyError:
+            key = get_cache_tag(tag)
+            if index >= 0:
+                key = key + '_%d' % index
+            _cache_keys[(tag, index)] = key
+            return key
 
     def _get_cache_valid(self, tag=None, index=-1, skip_disable=False):
         if not skip_disable and not self._driver_operation_cache:
             return False
-        tag = self._get_cache_tag(tag, 2)
-        if index >= 0:
-            tag = tag + '_%d' % index
+        if tag is None:
+            tag = self._cache_context.tag or ''
+        tag = self._get_cache_key(tag, index)
         try:
             return self._cache_valid[tag]
         except KeyError:
@@ -1885,14 +2481,83 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return False
 
     def _set_cache_valid(self, valid=True, tag=None, index=-1):
-        tag = self._get_cache_tag(tag, 2)
-        if index >= 0:
-            tag = tag + '_%d' % index
+        if tag is None:
+            tag = self._cache_context.tag or ''
+        tag = self._get_cache_key(tag, index)
         self._cache_valid[tag] = valid
+        # _cache_dependents holds (prefixes, tag) pairs, the tag is
+        # invalidated whenever an entry starting with one of the prefixes
+        # is updated
+        for prefixes, dep in self._cache_dependents:
+            if tag != dep and tag.startswith(prefixes):
+                self._cache_valid[dep] = False
 
     def _driver_operation_invalidate_all_attributes(self):
         self._cache_valid = dict()
 
+    @contextlib.contextmanager
+    def _driver_operation_batch(self):
+        self._write_batch_depth += 1
+        if self._write_batch is None:
+            self._write_batch = list()
+        start = len(self._write_batch)
+        flushes = self._write_batch_flushes
+        try:
+            yield
+        except:
+            # the block failed, drop what it queued instead of sending it;
+            # commands queued before the block are kept unless part of the
+            # block has been sent along with them already
+            if self._write_batch_flushes != flushes:
+                start = 0
+            if len(self._write_batch) > start:
+                del self._write_batch[start:]
+                self._write_batch_length = sum(len(c) + 1 for c in self._write_batch)
+                # the dropped setters have already updated their cached values
+                self._driver_operation_invalidate_all_attributes()
+            raise
+        finally:
+            self._write_batch_depth -= 1
+            if self._write_batch_depth == 0:
+                try:
+                    self._flush_write_batch()
+                finally:
+                    self._write_batch = None
+    
+    def _queue_write(self, data, encoding = 'utf-8'):
+        "Add command to the pending batch"
+        if type(data) is tuple or type(data) is list:
+            for data_i in data:
+                self._queue_write(data_i, encoding)
+            return
+        data = str(data)
+        if self._write_batch and (encoding != self._write_batch_encoding or
+                self._write_batch_length + len(data) + 2 > self._driver_operation_batch_size):
+            self._flush_write_batch()
+        data = anchor_command(data, self._write_batch)
+        self._write_batch.append(data)
+        self._write_batch_length += len(data) + 1
+        self._write_batch_encoding = encoding
+    
+    def _pop_write_batch(self):
+        "Remove pending commands from the batch and join them into one program message"
+        msg = ';'.join(self._write_batch)
+        del self._write_batch[:]
+        self._write_batch_length = 0
+        self._write_batch_flushes += 1
+        return msg
+    
+    def _flush_write_batch(self):
+        "Send pending batched commands"
+        if self._write_batch:
+            msg = self._pop_write_batch()
+            batch = self._write_batch
+            self._write_batch = None
+            try:
+                self._write(msg, self._write_batch_encoding)
+            finally:
+                self._write_batch = batch
+    
     def _write_raw(self, data):
         "Write binary data to instrument"
         if self._driver_operation_simulate:
@@ -1900,6 +2565,8 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         self._interface.write_raw(data)
     
     def _read_raw(self, num=-1):
@@ -1909,6 +2576,8 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return b''
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         return self._interface.read_raw(num)
     
     def _ask_raw(self, data, num=-1):
@@ -1918,6 +2587,8 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return b''
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         try:
             return self._interface.ask_raw(data, num)
         except AttributeError:
@@ -1932,6 +2603,9 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch is not None:
+            self._queue_write(data, encoding)
+            return
         try:
             self._interface.write(data, encoding)
         except AttributeError:
@@ -1950,6 +2624,8 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return ''
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         try:
             return self._interface.read(num, encoding)
         except AttributeError:
@@ -1962,6 +2638,13 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return ''
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            if type(data) is str:
+                # send pending commands and the query in one program message
+                self._queue_write(data, encoding)
+                data = self._pop_write_batch()
+            else:
+                self._flush_write_batch()
         try:
             return self._interface.ask(data, num, encoding)
         except AttributeError:
@@ -1976,7 +2659,55 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             self._write(data, encoding)
             return self._read(num, encoding)
     
-    def _ask_for_values(self, msg, delim=',', converter=float, array=True):
+    def _ask_multiple(self, queries, converters=None, encoding = 'utf-8'):
+        """
+        Send several queries in one program message and return the list of
+        responses
+        
+        Commands (entries whose header does not end in '?') may be interleaved
+        with the queries, for example to switch a source between two queries;
+        only the queries produce responses.  The compound response is read with
+        _read_response.  Responses that are IEEE blocks are returned as
+        bytearrays, everything else is decoded and stripped.  converters is either a
+        single callable applied to every response or a list with one callable
+        (or None) per query.
+        """
+        queries = list(queries)
+        # a '?' in the arguments, e.g. in a quoted string, is not a query
+        headers = [q.split(None, 1)[0] for q in queries if q.strip()]
+        count = len([h for h in headers if h.endswith('?')])
+        if len(queries) == 0:
+            return list()
+        if self._driver_operation_simulate:
+            print("[simulating] Ask multiple (%s) '%s'" % (encoding, queries))
+            return [''] * count
+        # anchor each query at the root so it is not relative to the previous one
+        msg = list()
+        for q in queries:
+            msg.append(anchor_command(q, msg))
+        msg = ';'.join(msg)
+        self._write(msg, encoding)
+        if count == 0:
+            return list()
+        fields = self._read_response()
+        if len(fields) != count:
+            raise UnexpectedResponseException("Expected %d responses, got %d" % (count, len(fields)))
+        out = list()
+        for i in range(len(fields)):
+            f = fields[i]
+            if _ieee_block_start.match(f):
+                val = decode_ieee_block(f)
+            else:
+                val = f.decode(encoding).strip()
+            conv = converters
+            if type(converters) is list or type(converters) is tuple:
+                conv = converters[i]
+            if conv is not None:
+                val = conv(val)
+            out.append(val)
+        return out
+    
+    def _ask_for_values(self, msg, delim=',', converter=float, array=True, format='ascii', byteorder='big'):
         '''
         write then read a list or array of data
         
@@ -1990,13 +2721,20 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             a datatype used to typecase the elements in the returned list
         array: bool
             convert the output to a numpy array 
+        format : str
+            data format of the response, 'ascii' or a SCPI binary format such
+            as 'real,32', 'real,64' or 'int,16'; binary data is read as an
+            IEEE block
+        byteorder : str
+            byte order of binary data, 'big' (SCPI normal) or 'little'
         
         '''
-        s = self._ask(msg)
-        s_split = s.split(delim)
-        out = map(converter, s_split)
-        if array:
-            out = np.array(out)
+        if format.lower() == 'ascii':
+            out = decode_ascii_values(self._ask(msg), delim, converter)
+        else:
+            out = decode_binary_values(self._ask_for_ieee_block(msg), format, byteorder)
+        if not array:
+            return out.tolist()
         return out
     
     def _read_stb(self):
@@ -2006,6 +2744,8 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             return 0
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         try:
             return self._interface.read_stb()
         except (AttributeError, NotImplementedError):
@@ -2017,10 +2757,13 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             print("[simulating] Trigger")
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         try:
             self._interface.trigger()
         except (AttributeError, NotImplementedError):
             self._write("*TRG")
+            self._flush_write_batch()
     
     def _clear(self):
         "Device clear"
@@ -2028,10 +2771,13 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             print("[simulating] Clear")
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         try:
             return self._interface.clear()
         except (AttributeError, NotImplementedError):
             self._write("*CLS")
+            self._flush_write_batch()
     
     def _remote(self):
         "Device set remote"
@@ -2039,6 +2785,8 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             print("[simulating] Remote")
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         return self._interface.remote()
     
     def _local(self):
@@ -2047,54 +2795,263 @@ class Driver(DriverOperation, DriverIdentity, DriverUtility):
             print("[simulating] Local")
         if not self._initialized or self._interface is None:
             raise NotInitializedException()
+        if self._write_batch:
+            self._flush_write_batch()
         return self._interface.local()
     
-    def _read_ieee_block(self):
-        "Read IEEE block"
+    def _read_response(self):
+        """
+        Read a compound response and split it into the responses to the
+        individual queries
+        
+        The response is read piecewise up to the message terminator, so it
+        does not rely on the interface returning the whole message from one
+        read (linux-gpib reads at most 512 bytes at a time, serial stops at
+        the first newline).  IEEE blocks are read by the length in their
+        header and may contain separators and newlines; separators inside
+        quoted strings are ignored as in split_response.  Returns one
+        bytearray per response, IEEE blocks keep their header (see
+        decode_ieee_block).
+        """
+        data = bytearray()
+        fields = list()
+        start = 0
+        ind = 0
+
+        def read(num=-1):
+            chunk = self._read_raw(num)
+            data.extend(chunk)
+            return len(chunk) > 0
+
+        while True:
+            m = _response_delimiter.search(data, ind)
+            if m is None:
+                ind = len(data)
+                if not read():
+                    break
+                continue
+            ind = m.start()
+            c = data[ind:ind+1]
+            if c == b';':
+                fields.append(data[start:ind])
+                start = ind = ind + 1
+            elif c == b'\n':
+                fields.append(data[start:ind])
+                return fields
+            elif c == b'#':
+                while len(data) < ind + 2 and read():
+                    pass
+                l = data[ind+1:ind+2]
+                if not l.isdigit():
+                    ind += 1
+                elif l == b'0':
+                    # indefinite length block, extends to the message terminator
+                    while data[-1:] != b'\n' and read():
+                        pass
+                    if data[-1:] == b'\n':
+                        del data[-1:]
+                    ind = len(data)
+                    break
+                else:
+                    l = int(l)
+                    while len(data) < ind + 2 + l:
+                        if not read(ind + 2 + l - len(data)):
+                            raise UnexpectedResponseException("Truncated IEEE block header")
+                    num = int(data[ind+2:ind+2+l])
+                    end = ind + 2 + l + num
+                    while len(data) < end:
+                        if not read(min(end - len(data), self._ieee_block_chunk_size)):
+                            raise UnexpectedResponseException("Expected %d bytes in IEEE block, got %d" % (num, len(data) - end + num))
+                    ind = end
+            else:
+                # quoted string, embedded quotes are doubled
+                ind += 1
+                while True:
+                    j = data.find(c, ind)
+                    if j < 0 or j + 1 == len(data):
+                        # closing quote not read yet or it may be doubled
+                        if read():
+                            continue
+                        ind = len(data) if j < 0 else j + 1
+                        break
+                    ind = j + 1
+                    if data[ind:ind+1] != c:
+                        break
+                    ind += 1
+
+        # no message terminator, the interface stripped it
+        fields.append(data[start:])
+        return fields
+
+    def _read_ieee_block_header(self):
+        """
+        Read IEEE block header
+        
+        Returns the payload length (None for an indefinite length block) and
+        any bytes read past the header, or None if there is no response.
+        """
         # IEEE block binary data is prefixed with #lnnnnnnnn
         # where l is length of n and n is the
         # length of the data
         # ex: #800002000 prefixes 2000 data bytes
 
-        ch = self._read_raw(1)
+        buf = self._read_raw(self._ieee_block_header_size)
 
-        if len(ch) == 0:
-            return b''
+        if len(buf) == 0:
+            return None
 
-        while ch != b'#':
-            ch = self._read_raw(1)
+        # skip any response header in front of the block
+        ind = buf.find(b'#')
+        while ind < 0:
+            buf = self._read_raw(self._ieee_block_header_size)
+            if len(buf) == 0:
+                raise UnexpectedResponseException("No IEEE block in response")
+            ind = buf.find(b'#')
 
-        l = int(self._read_raw(1))
-        if l > 0:
-            num = int(self._read_raw(l))
-            raw_data = self._read_raw(num)
-        else:
-            raw_data = self._read_raw()
+        while len(buf) < ind + 2:
+            buf += self._read_raw(ind + 2 - len(buf))
+        l = int(buf[ind+1:ind+2])
+
+        if l == 0:
+            return None, buf[ind+2:]
 
-        return raw_data
+        start = ind + 2 + l
+        while len(buf) < start:
+            buf += self._read_raw(start - len(buf))
+        return int(buf[ind+2:start]), buf[start:]
+
+    def _read_ieee_block_payload(self, num, buf, chunk_size=None, align=1):
+        """
+        Generator reading the payload of an IEEE block in chunks
+        
+        num and buf are as returned by _read_ieee_block_header.  Chunks are
+        at most chunk_size bytes and their lengths are multiples of align,
+        except possibly the last.  An indefinite length block is only yielded
+        once the message terminator has been read.
+        """
+        if chunk_size is None:
+            chunk_size = self._ieee_block_chunk_size
+        chunk_size = max(chunk_size - chunk_size % align, align)
+
+        if num is None:
+            # indefinite length block, read to the message terminator
+            data = bytearray(buf)
+            while data[-1:] != b'\n':
+                chunk = self._read_raw()
+                if len(chunk) == 0:
+                    break
+                data += chunk
+            if data[-1:] == b'\n':
+                del data[-1:]
+            view = memoryview(data)
+            for i in range(0, len(data), chunk_size):
+                yield view[i:i+chunk_size]
+            return
+
+        tail = buf[num:]
+        rest = buf[:num]
+        n = len(rest)
+        cut = n - n % align
+        if cut > 0:
+            yield rest[:cut]
+            rest = rest[cut:]
+
+        while n < num:
+            chunk = self._read_raw(min(num - n, chunk_size - len(rest)))
+            if len(chunk) == 0:
+                raise UnexpectedResponseException("Expected %d bytes in IEEE block, got %d" % (num, n))
+            n += len(chunk)
+            if len(rest):
+                chunk = rest + chunk
+            cut = len(chunk) - len(chunk) % align
+            if cut < len(chunk):
+                rest = chunk[cut:]
+                chunk = chunk[:cut]
+            else:
+                rest = b''
+            if len(chunk):
+                yield chunk
+
+        # flush message terminator
+        if len(tail) == 0:
+            self._read_raw()
+
+        if len(rest):
+            yield rest
+
+    def _read_ieee_block(self):
+        """
+        Read IEEE block
+        
+        The header is parsed from one buffered read and the payload is read
+        in chunks of at most _ieee_block_chunk_size bytes into a preallocated
+        bytearray, which can be wrapped with np.frombuffer without copying.
+        The message terminator following the block is consumed.
+        """
+        hdr = self._read_ieee_block_header()
+
+        if hdr is None:
+            return bytearray()
+
+        num, buf = hdr
+
+        if num is None:
+            data = bytearray()
+            for chunk in self._read_ieee_block_payload(num, buf):
+                data += chunk
+            return data
+
+        data = bytearray(num)
+        view = memoryview(data)
+        n = 0
+        for chunk in self._read_ieee_block_payload(num, buf):
+            view[n:n+len(chunk)] = chunk
+            n += len(chunk)
+
+        return data
+
+    def _read_ieee_block_chunks(self, chunk_size=None, align=1):
+        """
+        Read IEEE block as an iterator of chunks
+        
+        Only one chunk of at most chunk_size bytes (default
+        _ieee_block_chunk_size) is held at a time, so arbitrarily large
+        blocks can be processed with bounded memory.  Chunk lengths are
+        multiples of align so that each chunk holds whole samples.  The
+        iterator must be exhausted before the next instrument I/O.
+        """
+        hdr = self._read_ieee_block_header()
+
+        if hdr is None:
+            return iter(())
+
+        return self._read_ieee_block_payload(hdr[0], hdr[1], chunk_size, align)
     
     def _ask_for_ieee_block(self, data, encoding = 'utf-8'):
         "Write string then read IEEE block"
         self._write(data, encoding)
         return self._read_ieee_block()
 
+    def _ask_for_ieee_block_chunks(self, data, chunk_size=None, align=1, encoding = 'utf-8'):
+        "Write string then read IEEE block as an iterator of chunks"
+        self._write(data, encoding)
+        return self._read_ieee_block_chunks(chunk_size, align)
+
     def _write_ieee_block(self, data, prefix = None, encoding = 'utf-8'):
         "Write IEEE block"
         # IEEE block binary data is prefixed with #lnnnnnnnn
         # where l is length of n and n is the
         # length of the data
-        # ex: #800002000 prefixes 2000 data bytes
-        
-        block = b''
+        # ex: #42000 prefixes 2000 data bytes
+        # the transports terminate the message at the end of each write, so
+        # the block is sent as one message, assembled without extra copies
         
         if type(prefix) == str:
-            block = prefix.encode(encoding)
-        elif type(prefix) == bytes:
-            block = prefix
-        
-        block = block + build_ieee_block(data)
+            prefix = prefix.encode(encoding)
+        elif type(prefix) != bytes:
+            prefix = b''
         
-        self._write_raw(block)
+        self._write_raw(build_ieee_block(data, prefix))
     
     def doc(self, obj=None, itm=None, docs=None, prefix=None):
         """Python IVI documentation generator"""
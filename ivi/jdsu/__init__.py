@@ -24,7 +24,9 @@ THE SOFTWARE.
 
 """
 
-# Optical Grating Filters
-from .jdsuTB9 import jdsuTB9
-
+__all__ = [
+        # Optical Grating Filters
+        "jdsuTB9"]
 
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)
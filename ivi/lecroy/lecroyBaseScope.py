@@ -25,7 +25,8 @@ THE SOFTWARE.
 """
 
 import time
-import struct
+
+import numpy as np
 
 from .. import ivi
 from .. import scope
@@ -442,6 +443,18 @@ class lecroyBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.commo
                         Recalls the state of the instrument from an internal storage register
                         that was previously saved with memory.save.
                         """))
+        self._add_method('channels[].measurement.fetch_segments',
+                         self._measurement_fetch_segments,
+                         ivi.Doc("""
+                        Returns all segments of a sequence mode acquisition for the specified
+                        channel.
+
+                        The result is a tuple (waveform, time_tags).  waveform is a 2-D
+                        ivi.Waveform with one row per segment, time_tags is an array with the
+                        trigger time of each segment relative to the first one.  The wave
+                        description, trigger times and data of all segments are read in a
+                        single exchange.
+                        """))
 
         self._init_channels()
 
@@ -1243,7 +1256,8 @@ class lecroyBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.commo
         self._set_cache_valid()
 
     def _measurement_abort(self):
-        pass
+        if not self._driver_operation_simulate:
+            self._write("STOP")
 
     # def _get_trigger_tv_trigger_event(self):
     #     if not self._driver_operation_simulate and not self._get_cache_valid():
@@ -1406,72 +1420,139 @@ class lecroyBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.commo
     #     self._set_trigger_edge_slope(value)
 
     # Modified for LeCroy, WORKING ON WR104XI-A
-    def _measurement_fetch_waveform(self, index):
-        index = ivi.get_index(self._channel_name, index)
-
-        if self._driver_operation_simulate:
-            return list()
-
+    def _measurement_fetch_waveform_preamble(self, index):
         # Send the MSB first
         # old - self._write(":waveform:byteorder msbfirst")
         self._write("COMM_ORDER HI")
         self._write("COMM_FORMAT DEF9,WORD,BIN")
 
         # Read wave description and split up parts into variables
-        pre = self._ask("%s:INSPECT? WAVEDESC" % self._channel_name[index]).split("\r\n")
+        return self._measurement_fetch_waveform_parse_preamble(
+                self._ask("%s:INSPECT? WAVEDESC" % self._channel_name[index]))
 
+    def _measurement_fetch_waveform_parse_preamble(self, data):
+        pre = data.split("\r\n")
 
         # Replace following with a more simple solution, make it < Python 2.7 compatible
         temp = []
         for item in pre:
             temp.append(item.split(':'))
 
-        # Dict comprehension, python 2.7+
-        #mydict = {t[0].strip(): ["".join(elem.strip()) for elem in t[1:]] for t in temp}
-        #format = str(mydict["COMM_TYPE"][0])
-        #points = int(mydict["PNTS_PER_SCREEN"][0])
-        #xincrement = float(mydict["HORIZ_INTERVAL"][0])
-        #xorigin = float(mydict["HORIZ_OFFSET"][0])
-        #yincrement = float(mydict["VERTICAL_GAIN"][0])
-        #yorigin = float(mydict["VERTICAL_OFFSET"][0])
-
         # Dict with lost comprehension, python 2.6+
         mydict = dict([(d[0].strip(), "".join(d[1:]).strip()) for d in temp])
 
-        format = str(mydict["COMM_TYPE"])
-        points = int(mydict["PNTS_PER_SCREEN"])
-        xincrement = float(mydict["HORIZ_INTERVAL"])
-        xorigin = float(mydict["HORIZ_OFFSET"])
-        yincrement = float(mydict["VERTICAL_GAIN"])
-        yorigin = float(mydict["VERTICAL_OFFSET"])
-
         # Verify that the data is in 'word' format
-        if format.lower() != "word":
+        if str(mydict["COMM_TYPE"]).lower() != "word":
             raise ivi.UnexpectedResponseException()
 
+        return mydict
+
+    def _measurement_fetch_waveform_raw(self, index):
+        index = ivi.get_index(self._channel_name, index)
+
+        if self._driver_operation_simulate:
+            return ivi.RawWaveform(np.zeros(0, np.int16))
+
+        pre = self._measurement_fetch_waveform_preamble(index)
+
         # Read waveform data
         self._write("%s:WAVEFORM? DAT1" % self._channel_name[index])
-        raw_data = raw_data = self._read_ieee_block()
+        raw_data = self._read_ieee_block()
+
+        return self._measurement_fetch_waveform_decode(raw_data, pre)
+
+    def _measurement_fetch_waveform_window(self, index, start=None, stop=None, units='points'):
+        index = ivi.get_index(self._channel_name, index)
+
+        if self._driver_operation_simulate:
+            return ivi.Waveform([])
+
+        pre = self._measurement_fetch_waveform_preamble(index)
+        x_increment = float(pre["HORIZ_INTERVAL"])
+        x_origin = float(pre["HORIZ_OFFSET"])
+        first, last = scope.get_waveform_window(start, stop, units,
+                x_origin, x_increment, int(pre["PNTS_PER_SCREEN"]))
+        if last == first:
+            return ivi.Waveform(np.zeros(0), x_origin + first * x_increment, x_increment, pre)
+
+        # transfer only the window, then restore the full record setup
+        self._write("WAVEFORM_SETUP SP,0,NP,%d,FP,%d,SN,0;%s:WAVEFORM? DAT1"
+                % (last - first, first, self._channel_name[index]))
+        raw_data = self._read_ieee_block()
+        self._write("WAVEFORM_SETUP SP,0,NP,0,FP,0,SN,0")
+
+        raw = self._measurement_fetch_waveform_decode(raw_data, pre)
+        raw.x_origin += first * raw.x_increment
+        return raw.to_waveform()
+
+    def _measurement_fetch_waveform_decode(self, raw_data, pre):
+        points = int(pre["PNTS_PER_SCREEN"])
+        xincrement = float(pre["HORIZ_INTERVAL"])
+        xorigin = float(pre["HORIZ_OFFSET"])
+        yincrement = float(pre["VERTICAL_GAIN"])
+        yorigin = float(pre["VERTICAL_OFFSET"])
+
+        # signed big endian words, a code of 0 is a hole
+        y_data = np.frombuffer(raw_data, '>i2', len(raw_data) // 2)[:points]
+
+        return ivi.RawWaveform(y_data, yincrement, -yorigin, 0, 0,
+                xincrement, xorigin, 0, pre)
+
+    def _measurement_fetch_waveform(self, index):
+        return self._measurement_fetch_waveform_raw(index).to_waveform()
+
+    def _measurement_fetch_waveform_records(self, channels):
+        channels = [ivi.get_index(self._channel_name, index) for index in channels]
+
+        if self._driver_operation_simulate:
+            return [self._measurement_fetch_waveform_raw(index) for index in channels]
+
+        # Request format, wave descriptions and data of all channels in one
+        # message, the responses come back as description, block pairs
+        msg = ["COMM_ORDER HI", "COMM_FORMAT DEF9,WORD,BIN"]
+        for index in channels:
+            msg.append("%s:INSPECT? WAVEDESC" % self._channel_name[index])
+            msg.append("%s:WAVEFORM? DAT1" % self._channel_name[index])
+        self._write(';'.join(msg))
+
+        fields = self._read_response() if channels else []
+        if len(fields) != 2 * len(channels):
+            raise ivi.UnexpectedResponseException()
+
+        records = list()
+        for i in range(len(channels)):
+            pre = self._measurement_fetch_waveform_parse_preamble(fields[2*i].decode('utf-8').rstrip())
+            records.append(self._measurement_fetch_waveform_decode(ivi.decode_ieee_block(fields[2*i+1]), pre))
+
+        return records
+
+    def _measurement_fetch_segments(self, index):
+        index = ivi.get_index(self._channel_name, index)
 
-        # Split out points and convert to time and voltage pairs
-        data = list()
-        for i in range(points):
-            x = (i * xincrement) + xorigin
+        if self._driver_operation_simulate:
+            return (ivi.Waveform(np.zeros((0, 0))), np.zeros(0))
+
+        name = self._channel_name[index]
+        self._write("COMM_ORDER HI;COMM_FORMAT DEF9,WORD,BIN;%s:INSPECT? WAVEDESC;%s:WAVEFORM? TIME;%s:WAVEFORM? DAT1"
+                % (name, name, name))
 
-            yval = struct.unpack(">H", raw_data[i * 2:i * 2 + 2])[0]
+        fields = self._read_response()
+        if len(fields) != 3:
+            raise ivi.UnexpectedResponseException()
 
-            if yval > 32767:
-                yval = yval - (2 ** 16)
+        pre = self._measurement_fetch_waveform_parse_preamble(fields[0].decode('utf-8').rstrip())
+        count = max(int(pre.get("SUBARRAY_COUNT", 1)), 1)
 
-            if yval == 0:
-                # hole value
-                y = float('nan')
-            else:
-                y = (yincrement * yval) - yorigin
+        # the trigger time array holds a (trigger time, trigger offset) pair
+        # of doubles per segment
+        time_tags = np.frombuffer(ivi.decode_ieee_block(fields[1]), '>f8')[0::2][:count]
 
-            data.append((x, y))
+        # the data array holds the segments one after another
+        data = memoryview(ivi.decode_ieee_block(fields[2]))
+        n = (len(data) // count) & ~1
+        records = [self._measurement_fetch_waveform_decode(data[i*n:(i+1)*n], pre) for i in range(count)]
 
-        return data
+        return (ivi.Waveform.stack(records), time_tags)
 
     def _measurement_read_waveform(self, index, maximum_time):
         return self._measurement_fetch_waveform(index)
@@ -1482,6 +1563,15 @@ class lecroyBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.commo
             self._write(":digitize")
             self._set_cache_valid(False, 'trigger_continuous')
 
+    def _measurement_stream_initiate(self, channels):
+        if not self._driver_operation_simulate:
+            self._write("ARM_ACQUISITION")
+            self._set_cache_valid(False, 'trigger_continuous')
+
+    def _measurement_stream_wait(self):
+        if not self._driver_operation_simulate:
+            self._ask("WAIT;*OPC?")
+
     def _get_reference_level_high(self):
         return self._reference_level_high
 
@@ -1556,14 +1646,6 @@ class lecroyBaseScope(scpi.common.IdnCommand, scpi.common.ErrorQuery, scpi.commo
     def _set_acquisition_number_of_envelopes(self, value):
         self._acquisition_number_of_envelopes = value
 
-    def _measurement_fetch_waveform_min_max(self, index):
-        index = ivi.get_index(self._channel_name, index)
-        data = list()
-        return data
-
-    def _measurement_read_waveform_min_max(self, index, maximum_time):
-        return _measurement_fetch_waveform_min_max(index)
-
     def _get_trigger_continuous(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
             self._trigger_continuous = (int(self._ask(":oper:cond?")) & 1 << 3) != 0
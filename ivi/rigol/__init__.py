@@ -24,15 +24,18 @@ THE SOFTWARE.
 
 """
 
-# DC Power Supplies
-# DP800
-from .rigolDP831A import rigolDP831A
-from .rigolDP832 import rigolDP832
-from .rigolDP832A import rigolDP832A
-# DP1000
-from .rigolDP1116A import rigolDP1116A
-from .rigolDP1308A import rigolDP1308A
-
-# Digital Multimeters
-#DM3068
-from .rigolDM3068Agilent import rigolDM3068Agilent
+__all__ = [
+        # DC Power Supplies
+        # DP800
+        "rigolDP831A",
+        "rigolDP832",
+        "rigolDP832A",
+        # DP1000
+        "rigolDP1116A",
+        "rigolDP1308A",
+        # Digital Multimeters
+        #DM3068
+        "rigolDM3068Agilent"]
+
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)
@@ -24,8 +24,12 @@ THE SOFTWARE.
 
 """
 
-# Oscilloscopes
-from .hmo1002 import hmo1002
-from .rtc1002 import rtc1002
-# Digital Multimeters
-from .hmc8012 import hmc8012
+__all__ = [
+        # Oscilloscopes
+        "hmo1002",
+        "rtc1002",
+        # Digital Multimeters
+        "hmc8012"]
+
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)
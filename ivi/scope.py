@@ -24,6 +24,14 @@ THE SOFTWARE.
 
 """
 
+import math
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 from . import ivi
 
 # Exceptions
@@ -53,6 +61,24 @@ MeasurementFunction = set(['rise_time', 'fall_time', 'frequency', 'period',
         'amplitude', 'voltage_cycle_rms', 'voltage_cycle_average',
         'overshoot', 'preshoot'])
 AcquisitionStatus = set(['complete', 'in_progress', 'unknown'])
+WaveformWindowUnits = set(['points', 'time'])
+
+def get_waveform_window(start, stop, units, x_origin, x_increment, points):
+    """Convert a waveform window to the sample range first:last
+    
+    For units 'points' start and stop are sample indices with the semantics
+    of a slice, for 'time' the window holds the samples with
+    start <= x <= stop.  The range is clipped to the record."""
+    if units not in WaveformWindowUnits:
+        raise ivi.ValueNotSupportedException()
+    if units == 'time':
+        # tolerate rounding errors of the x axis
+        if start is not None:
+            start = max(int(math.ceil((start - x_origin) / x_increment - 1e-6)), 0)
+        if stop is not None:
+            stop = max(int(math.floor((stop - x_origin) / x_increment + 1e-6)) + 1, 0)
+    first, last, step = slice(start, stop).indices(points)
+    return first, max(last, first)
 
 class Base(ivi.IviContainer):
     "Base IVI methods for all oscilloscopes"
@@ -82,6 +108,7 @@ class Base(ivi.IviContainer):
         self._channel_range = list()
         self._channel_count = 1
         self._measurement_status = 'unknown'
+        self._measurement_stream_timeout = 10
         self._trigger_coupling = 'dc'
         self._trigger_holdoff = 0
         self._trigger_level = 0
@@ -319,6 +346,70 @@ class Base(ivi.IviContainer):
                         interaction with the instrument. Call the Error Query function at the
                         conclusion of the sequence to check the instrument status.
                         """, cls, grp, '4.3.13'))
+        self._add_method('channels[].measurement.fetch_waveform_raw',
+                        self._measurement_fetch_waveform_raw,
+                        ivi.Doc("""
+                        This function returns the waveform the oscilloscope acquires for the
+                        specified channel as raw sample codes, without converting them to
+                        voltages.  Preconditions are the same as for Fetch Waveform.
+                        
+                        The result is an ivi.RawWaveform holding the integer sample array as
+                        transferred by the instrument together with the coefficients to convert
+                        it.  Call its to_waveform method to convert the whole record, or
+                        iter_chunks to convert it in pieces.
+                        """))
+        self._add_method('channels[].measurement.fetch_waveform_window',
+                        self._measurement_fetch_waveform_window,
+                        ivi.Doc("""
+                        This function returns part of the waveform the oscilloscope acquired for
+                        the specified channel.  Preconditions are the same as for Fetch
+                        Waveform.
+                        
+                        units selects how start and stop are interpreted:
+                        
+                        * 'points': sample indices, with the semantics of a Python slice
+                        * 'time': the window holds the samples with start <= x <= stop
+                        
+                        None leaves that side of the window open.  Drivers restrict the
+                        transfer to the window where the instrument supports it, so the
+                        transfer time scales with the window rather than the record length.
+                        """))
+        self._add_method('measurement.fetch_waveforms',
+                        self._measurement_fetch_waveforms,
+                        ivi.Doc("""
+                        This function returns the waveforms the oscilloscope acquired for
+                        several channels in a single call.  Preconditions are the same as for
+                        Fetch Waveform.
+                        
+                        channels is a list of channel names or indices.  The result is a 2-D
+                        ivi.Waveform with one row of y per channel in the order requested.  All
+                        rows share the time base of the first channel and are truncated to the
+                        shortest record.  Drivers pipeline the source selection and data
+                        queries where the instrument allows it.
+                        """))
+        self._add_method('measurement.stream',
+                        self._measurement_stream,
+                        ivi.Doc("""
+                        Returns an iterator that acquires and fetches the specified channels
+                        repeatedly and yields one 2-D ivi.Waveform per acquisition, as returned
+                        by Fetch Waveforms.
+                        
+                        The instrument I/O runs in a background thread which arms the next
+                        acquisition as soon as the previous one has been transferred, so the
+                        oscilloscope acquires while the host converts and stores the previous
+                        records.  Transferred acquisitions wait in a queue of at most
+                        queue_size entries; when it is full, no further acquisitions are
+                        started until the consumer catches up.
+                        
+                        count is the number of acquisitions, None streams until the iterator
+                        is closed.  Closing the iterator (or leaving a for loop over it) stops
+                        the background thread once its current instrument operation completes
+                        and aborts the pending acquisition; Operation Pending is raised if the
+                        thread does not stop within _measurement_stream_timeout seconds, which
+                        should exceed the I/O timeout.  Errors in
+                        the background thread are raised from the iterator.  Do not access
+                        the driver from other code while the stream is running.
+                        """))
         self._add_method('channels[].measurement.read_waveform',
                         self._measurement_read_waveform,
                         ivi.Doc("""
@@ -748,9 +839,92 @@ class Base(ivi.IviContainer):
     
     def _measurement_fetch_waveform(self, index):
         index = ivi.get_index(self._channel_name, index)
-        data = list()
+        data = ivi.Waveform([])
         return data
     
+    def _measurement_fetch_waveform_raw(self, index):
+        index = ivi.get_index(self._channel_name, index)
+        data = ivi.RawWaveform([])
+        return data
+    
+    def _measurement_fetch_waveform_window(self, index, start=None, stop=None, units='points'):
+        wfm = self._measurement_fetch_waveform(index)
+        first, last = get_waveform_window(start, stop, units, wfm.x_origin, wfm.x_increment, len(wfm))
+        return wfm[first:last]
+    
+    def _measurement_fetch_waveform_records(self, channels):
+        return [self._measurement_fetch_waveform(index) for index in channels]
+    
+    def _measurement_fetch_waveforms(self, channels):
+        return ivi.Waveform.stack(self._measurement_fetch_waveform_records(channels))
+    
+    def _measurement_stream_initiate(self, channels):
+        self._measurement_initiate()
+    
+    def _measurement_stream_wait(self):
+        pass
+    
+    def _measurement_stream(self, channels, count=None, queue_size=2):
+        channels = list(channels)
+        records = queue.Queue(max(queue_size, 1))
+        stop = threading.Event()
+        
+        def put(item):
+            while not stop.is_set():
+                try:
+                    records.put(item, True, 0.1)
+                    return
+                except queue.Full:
+                    pass
+        
+        def acquire():
+            # only this thread accesses the instrument, including the abort
+            armed = False
+            try:
+                n = 0
+                while (count is None or n < count) and not stop.is_set():
+                    if not armed:
+                        self._measurement_stream_initiate(channels)
+                        armed = True
+                    self._measurement_stream_wait()
+                    data = self._measurement_fetch_waveform_records(channels)
+                    armed = False
+                    n += 1
+                    # arm the next acquisition before handing over the records
+                    if (count is None or n < count) and not stop.is_set():
+                        self._measurement_stream_initiate(channels)
+                        armed = True
+                    put((data, None))
+                if armed:
+                    self._measurement_abort()
+                put((None, None))
+            except Exception as e:
+                if armed:
+                    try:
+                        self._measurement_abort()
+                    except Exception:
+                        pass
+                put((None, e))
+        
+        thread = threading.Thread(target=acquire)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                data, error = records.get()
+                if error is not None:
+                    raise error
+                if data is None:
+                    return
+                yield ivi.Waveform.stack(data)
+        finally:
+            # the background thread stops after the current instrument
+            # operation and aborts a pending acquisition itself
+            stop.set()
+            thread.join(self._measurement_stream_timeout)
+            if thread.is_alive():
+                raise ivi.OperationPendingException("Stream thread did not stop")
+    
     def _measurement_read_waveform(self, index, maximum_time):
         return self._measurement_fetch_waveform(index)
     
@@ -1478,7 +1652,8 @@ class MinMaxWaveform(ivi.IviContainer):
                         MaxWaveform parameters is either a voltage or a value indicating that the
                         oscilloscope could not sample a voltage.
                         
-                        The return value is a list of (x, y_min, y_max) tuples that represent the
+                        The return value is an ivi.Envelope with y_min and y_max arrays.
+                        Iterating over it yields (x, y_min, y_max) tuples that represent the
                         time and voltage of each data point.  Either of the y points may be NaN in
                         the case that the oscilloscope could not sample the voltage.
                         
@@ -1492,6 +1667,11 @@ class MinMaxWaveform(ivi.IviContainer):
                         
                         any(any(math.isnan(b) for b in a) for a in waveform)
                         
+                        Where the instrument does not return min/max pairs for the current
+                        acquisition type, the driver fetches the waveform and reduces it to at
+                        most bins (default 1000) minimum/maximum pairs.  Records that are
+                        already min/max pairs are reduced the same way if they are longer.
+                        
                         This function does not check the instrument status. Typically, the
                         end-user calls this function only in a sequence of calls to other
                         low-level driver functions. The sequence performs one operation. The
@@ -1518,7 +1698,8 @@ class MinMaxWaveform(ivi.IviContainer):
                         complete the acquisition within the time period the user specified with
                         the max_time parameter, the function returns the Max Time Exceeded error.
                         
-                        The return value is a list of (x, y_min, y_max) tuples that represent the
+                        The return value is an ivi.Envelope with y_min and y_max arrays.
+                        Iterating over it yields (x, y_min, y_max) tuples that represent the
                         time and voltage of each data point.  Either of the y points may be NaN in
                         the case that the oscilloscope could not sample the voltage.
                         
@@ -1546,13 +1727,11 @@ class MinMaxWaveform(ivi.IviContainer):
     def _set_acquisition_number_of_envelopes(self, value):
         self._acquisition_number_of_envelopes = value
     
-    def _measurement_fetch_waveform_min_max(self, index):
-        index = ivi.get_index(self._channel_name, index)
-        data = list()
-        return data
+    def _measurement_fetch_waveform_min_max(self, index, bins=1000):
+        return self._measurement_fetch_waveform(index).envelope(bins)
     
     def _measurement_read_waveform_min_max(self, index, maximum_time):
-        return _measurement_fetch_waveform_min_max(index)
+        return self._measurement_fetch_waveform_min_max(index)
 
 
 class ProbeAutoSense(ivi.IviContainer):
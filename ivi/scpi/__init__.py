@@ -30,5 +30,6 @@ __all__ = [
         # IVI implementations
         "dcpwr", "dmm"]
 
-from . import *
+from .. import ivi
+ivi.lazy_import(__name__, modules=__all__)
 
@@ -97,6 +97,30 @@ class Reset(object):
         self._utility_reset()
 
 
+class DataFormat(object):
+    "Implementation of SCPI data format selection for bulk transfers"
+
+    def __init__(self, *args, **kwargs):
+        super(DataFormat, self).__init__(*args, **kwargs)
+
+        self._data_format = 'ascii'
+        self._data_format_preferred = 'real,64'
+
+    def _get_data_format(self):
+        if not self._driver_operation_simulate and not self._get_cache_valid():
+            self._set_data_format(self._data_format_preferred)
+        return self._data_format
+
+    def _set_data_format(self, value):
+        value = str(value).lower().replace(' ', '')
+        if not self._driver_operation_simulate:
+            self._write(":format:data %s" % value)
+            if value != 'ascii':
+                self._write(":format:border normal")
+        self._data_format = value
+        self._set_cache_valid()
+
+
 class SelfTest(object):
     "Implementation of standard SCPI self test"
 
@@ -269,9 +269,12 @@ class Base(common.IdnCommand, common.ErrorQuery, common.Reset, common.SelfTest,
         if not self._driver_operation_simulate:
             self._write(":abort")
     
+    def _get_data_format(self):
+        return 'ascii'
+    
     def _measurement_fetch(self, max_time):
         if not self._driver_operation_simulate:
-            return float(self._ask(":fetch?"))
+            return float(self._ask_for_values(":fetch?", format=self._get_data_format())[0])
         return 0.0
     
     def _measurement_initiate(self):
@@ -289,7 +292,7 @@ class Base(common.IdnCommand, common.ErrorQuery, common.Reset, common.SelfTest,
     
     def _measurement_read(self, max_time):
         if not self._driver_operation_simulate:
-            return float(self._ask(":read?"))
+            return float(self._ask_for_values(":read?", format=self._get_data_format())[0])
         return 0.0
     
     
@@ -357,12 +360,12 @@ class MultiPoint(dmm.MultiPoint):
     
     def _measurement_fetch_multi_point(self, max_time, num_of_measurements = 0):
         if not self._driver_operation_simulate:
-            return self._ask_for_values(":fetch?", array=False)
+            return self._ask_for_values(":fetch?", array=False, format=self._get_data_format())
         return [0.0 for i in range(self._trigger_multi_point_count*self._trigger_multi_point_sample_count)]
     
     def _measurement_read_multi_point(self, max_time, num_of_measurements = 0):
         if not self._driver_operation_simulate:
-            return self._ask_for_values(":read?", array=False)
+            return self._ask_for_values(":read?", array=False, format=self._get_data_format())
         return [0.0 for i in range(self._trigger_multi_point_count*self._trigger_multi_point_sample_count)]
     
     
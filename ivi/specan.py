@@ -24,6 +24,8 @@ THE SOFTWARE.
 
 """
 
+import numpy as np
+
 from . import ivi
 
 # Exceptions
@@ -36,6 +38,142 @@ DetectorType = set(['auto_peak', 'average', 'maximum_peak', 'minimum_peak', 'sam
 TraceType = set(['clear_write', 'maximum_hold', 'minimum_hold', 'video_average', 'view', 'store'])
 VerticalScale = set(['linear', 'logarithmic'])
 AcquisitionStatus = set(['complete', 'in_progress', 'unknown'])
+MarkerSearchType = set(['highest', 'minimum', 'next_peak', 'next_peak_left', 'next_peak_right'])
+
+def find_peaks(y, excursion=0.0, threshold=None):
+    """Find the peaks of a trace, returns their indices in increasing order
+    
+    A peak is a local maximum that rises and falls by at least excursion on
+    both sides before the trace reaches a higher peak or the end of the trace,
+    and that is at or above threshold.  The first point of a flat top is
+    reported."""
+    y = np.asarray(y, np.float64)
+    if len(y) < 3:
+        return np.zeros(0, np.intp)
+    # collapse runs of equal values so flat tops are single points
+    start = np.flatnonzero(np.r_[True, y[1:] != y[:-1]])
+    z = y[start]
+    p = np.flatnonzero((z[1:-1] > z[:-2]) & (z[1:-1] > z[2:])) + 1
+    while len(p):
+        # lowest point before the first peak, between peaks and after the last
+        valley = np.r_[z[:p[0]].min(), np.minimum.reduceat(z, p)]
+        h = z[p]
+        fail_left = h - valley[:-1] < excursion
+        fail_right = h - valley[1:] < excursion
+        # a peak that does not clear the excursion towards a higher neighbour
+        # is part of that neighbour; the valleys are widened and checked again
+        higher_left = np.r_[True, h[:-1] >= h[1:]]
+        higher_right = np.r_[h[1:] > h[:-1], True]
+        drop = (fail_left & higher_left) | (fail_right & higher_right)
+        if not drop.any():
+            break
+        p = p[~drop]
+    if threshold is not None:
+        p = p[z[p] >= threshold]
+    return start[p]
+
+def band_power(y, x, start, stop, bandwidth=None):
+    """Total power in dBm of the points of a trace in dBm between start and stop
+    
+    With bandwidth, the noise bandwidth of the resolution filter, the points
+    are scaled by their spacing so the result is the power density
+    integrated over the band, otherwise the point powers are summed."""
+    y = np.asarray(y, np.float64)
+    x = np.asarray(x, np.float64)
+    sel = (x >= min(start, stop)) & (x <= max(start, stop))
+    p = np.sum(10 ** (y[sel] / 10))
+    if bandwidth and len(x) > 1:
+        p *= abs(x[-1] - x[0]) / (len(x) - 1) / bandwidth
+    if p <= 0:
+        return -np.inf
+    return 10 * np.log10(p)
+
+def stack_traces(traces):
+    "Stack a list of traces of equal length into a 2-D float array"
+    traces = [np.asarray(t) for t in traces]
+    n = len(traces[0]) if traces else 0
+    out = np.empty((len(traces), n), np.float64)
+    for i in range(len(traces)):
+        if len(traces[i]) != n:
+            raise ivi.UnexpectedResponseException("Trace lengths differ, %d and %d points" % (n, len(traces[i])))
+        out[i] = traces[i]
+    return out
+
+class Trace(object):
+    """
+    Spectrum analyzer trace with host-side marker functions
+    
+    x holds the frequency (or wavelength) and y the amplitude of each point.
+    Peak search, delta markers and band power are computed from the arrays,
+    so any number of marker queries can be answered from one trace fetch.
+    Markers are point indices; x[i] and y[i] are the marker position and
+    amplitude.  peak_excursion and threshold apply to all peak searches.
+    """
+    
+    def __init__(self, x, y, peak_excursion=0.0, threshold=None):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.peak_excursion = peak_excursion
+        self.threshold = threshold
+        self._peaks = None
+        self._peaks_key = None
+    
+    def __len__(self):
+        return len(self.y)
+    
+    def peaks(self):
+        "Indices of the peaks in increasing order"
+        key = (self.peak_excursion, self.threshold)
+        if self._peaks is None or self._peaks_key != key:
+            self._peaks = find_peaks(self.y, self.peak_excursion, self.threshold)
+            self._peaks_key = key
+        return self._peaks
+    
+    def highest_peaks(self, count=None):
+        "Indices of the count highest peaks, highest first"
+        p = self.peaks()
+        p = p[np.argsort(-self.y[p], kind='mergesort')]
+        return p[:count]
+    
+    def search(self, search_type='highest', index=None):
+        """Marker search, returns the index found or None
+        
+        search_type is one of MarkerSearchType; the next peak searches start
+        from the marker at index.  next_peak finds the highest peak below the
+        marker amplitude, next_peak_left and next_peak_right the closest peak
+        on that side of the marker."""
+        if search_type not in MarkerSearchType:
+            raise ivi.ValueNotSupportedException()
+        if len(self.y) == 0:
+            return None
+        if search_type == 'highest':
+            return int(np.nanargmax(self.y))
+        if search_type == 'minimum':
+            return int(np.nanargmin(self.y))
+        if index is None:
+            raise ivi.ValueNotSupportedException()
+        p = self.peaks()
+        if search_type == 'next_peak':
+            p = p[self.y[p] < self.y[index]]
+            if len(p):
+                return int(p[np.argmax(self.y[p])])
+        elif search_type == 'next_peak_left':
+            p = p[p < index]
+            if len(p):
+                return int(p[-1])
+        else:
+            p = p[p > index]
+            if len(p):
+                return int(p[0])
+        return None
+    
+    def delta(self, index, reference):
+        "Position and amplitude of the marker at index relative to the one at reference"
+        return (self.x[index] - self.x[reference], self.y[index] - self.y[reference])
+    
+    def band_power(self, start, stop, bandwidth=None):
+        "Power in dBm between start and stop, see band_power"
+        return band_power(self.y, self.x, start, stop, bandwidth)
 
 class Base(ivi.IviContainer):
     "Base IVI methods for all spectrum analyzers"
@@ -343,6 +481,29 @@ class Base(ivi.IviContainer):
                        Error Query function at the conclusion of the sequence to check the
                        instrument status.
                        """)
+        self._add_method('acquisition.fetch_traces',
+                       self._acquisition_fetch_traces,
+                       """
+                       This function returns several traces the spectrum analyzer acquired in a
+                       single call. Preconditions are the same as for the Fetch Y Trace
+                       function.
+                       
+                       traces is a list of trace names or indices and defaults to all traces.
+                       The result is a 2-D array with one row of amplitudes per trace in the
+                       order requested; traces of different lengths raise Unexpected Response.
+                       Drivers set up the transfer and determine the scaling once for all of
+                       the traces.
+                       """)
+        self._add_method('traces[].fetch_trace',
+                       self._trace_fetch_trace,
+                       """
+                       This function returns the trace as a specan.Trace holding the amplitude
+                       array of Fetch Y Trace together with the frequency of each point.
+                       Preconditions are the same as for the Fetch Y Trace function.
+                       
+                       Peak search, next peak, delta marker and band power queries on the
+                       returned trace are computed on the host without further instrument I/O.
+                       """)
         self._add_method('acquisition.initiate',
                        self._acquisition_initiate,
                        """
@@ -599,6 +760,16 @@ class Base(ivi.IviContainer):
         data = list()
         return data
     
+    def _trace_fetch_trace(self, index):
+        y = np.asarray(self._trace_fetch_y(index), np.float64)
+        x = np.linspace(self._get_frequency_start(), self._get_frequency_stop(), len(y))
+        return Trace(x, y)
+    
+    def _acquisition_fetch_traces(self, traces=None):
+        if traces is None:
+            traces = self._trace_name
+        return stack_traces([self._trace_fetch_y(t) for t in traces])
+    
     def _acquisition_initiate(self):
         pass
     
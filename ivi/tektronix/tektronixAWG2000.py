@@ -24,8 +24,8 @@ THE SOFTWARE.
 
 """
 
+import re
 import time
-import struct
 from numpy import *
 
 from .. import ivi
@@ -47,6 +47,7 @@ class tektronixAWG2000(ivi.Driver, fgen.Base, fgen.StdFunc, fgen.ArbWfm,
     
     def __init__(self, *args, **kwargs):
         self.__dict__.setdefault('_instrument_id', '')
+        self._catalog_names = list()
         
         super(tektronixAWG2000, self).__init__(*args, **kwargs)
         
@@ -57,15 +58,13 @@ class tektronixAWG2000(ivi.Driver, fgen.Base, fgen.StdFunc, fgen.ArbWfm,
         self._arbitrary_waveform_size_max = 256*1024
         self._arbitrary_waveform_size_min = 64
         self._arbitrary_waveform_quantum = 8
+        self._arbitrary_waveform_sample_format = ('>u2', 12)
         
         self._arbitrary_sequence_number_sequences_max = 0
         self._arbitrary_sequence_loop_count_max = 0
         self._arbitrary_sequence_length_max = 0
         self._arbitrary_sequence_length_min = 0
         
-        self._catalog_names = list()
-        
-        self._arbitrary_waveform_n = 0
         self._arbitrary_sequence_n = 0
         
         self._identity_description = "Tektronix AWG2000 series arbitrary waveform generator driver"
@@ -102,6 +101,10 @@ class tektronixAWG2000(ivi.Driver, fgen.Base, fgen.StdFunc, fgen.ArbWfm,
         if reset:
             self.utility_reset()
         
+        # pick up waveforms already stored on the instrument
+        if not self._driver_operation_simulate:
+            self._load_catalog()
+        
     
     def _load_id_string(self):
         if self._driver_operation_simulate:
@@ -201,6 +204,10 @@ class tektronixAWG2000(ivi.Driver, fgen.Base, fgen.StdFunc, fgen.ArbWfm,
             l = [s.strip('"') for s in l]
             self._catalog = [l[i:i+3] for i in range(0, len(l), 3)]
             self._catalog_names = [l[0] for l in self._catalog]
+            # waveforms created by the driver are named after their content
+            # key, ones from earlier sessions are checked before reuse
+            self._arbitrary_waveform_cache_sync(n for n in self._catalog_names
+                    if re.match(r'^[0-9a-f]{8}\.wfm$', n))
     
     def _get_output_operation_mode(self, index):
         index = ivi.get_index(self._output_name, index)
@@ -458,68 +465,92 @@ class tektronixAWG2000(ivi.Driver, fgen.Base, fgen.StdFunc, fgen.ArbWfm,
         return self._arbitrary_waveform_quantum
     
     def _arbitrary_waveform_clear(self, handle):
-        pass
+        handle = str(handle).lower()
+        if not self._driver_operation_simulate:
+            self._write(":memory:delete \"%s\"" % handle)
+        if handle in self._catalog_names:
+            self._catalog_names.remove(handle)
+        self._arbitrary_waveform_cache_discard(handle)
+    
+    def _arbitrary_waveform_check(self, handle, points, xincr):
+        "Check that a stored waveform has the given length and sample interval"
+        resp = self._ask_multiple([":data:source \"%s\"" % handle, ":wfmpre:nr_pt?", ":wfmpre:xincr?"],
+                lambda r: float(r.split()[-1]))
+        return int(resp[0]) == points and abs(resp[1] - xincr) <= 1e-6 * xincr
+    
+    def _arbitrary_waveform_memory_full(self):
+        "Check the event queue after an upload, True if it failed for lack of memory"
+        # query, device, execution and command errors
+        if not int(self._ask("*esr?")) & 0x3c:
+            return False
+        events = list()
+        while True:
+            code, message = self._ask(":evmsg?").split(',', 1)
+            code = int(code.split()[-1])
+            # 0 and 1 report an empty queue
+            if code in (0, 1):
+                break
+            events.append((code, message.strip(' "')))
+        # out of memory, 225 (SCPI -225)
+        if [c for c, m in events if abs(c) == 225]:
+            return True
+        if events:
+            raise ivi.InstrumentStatusExcpetion("%d, %s" % events[0])
+        return False
     
     def _arbitrary_waveform_create(self, data):
-        y = None
-        x = None
-        if type(data) == list and type(data[0]) == float:
-            # list
-            y = array(data)
-        elif type(data) == ndarray and len(data.shape) == 1:
-            # 1D array
-            y = data
-        elif type(data) == ndarray and len(data.shape) == 2 and data.shape[0] == 1:
-            # 2D array, hieght 1
-            y = data[0]
-        elif type(data) == ndarray and len(data.shape) == 2 and data.shape[1] == 1:
-            # 2D array, width 1
-            y = data[:,0]
-        else:
-            x, y = ivi.get_sig(data)
+        x, raw_data = self._arbitrary_waveform_encode(data)
         
         if x is None:
-            x = arange(0,len(y)) / 10e6
-        
-        if len(y) % self._arbitrary_waveform_quantum != 0:
-            raise ivi.ValueNotSupportedException()
+            xincr = 1 / 10e6
+        else:
+            xincr = ivi.rms(diff(x))
         
-        xincr = ivi.rms(diff(x))
+        # reuse the waveform if the instrument already holds a copy
+        key = self._arbitrary_waveform_cache_key(raw_data, "%e" % xincr)
+        handle = self._arbitrary_waveform_cache_get(key)
+        if handle is not None:
+            return handle
         
-        # get unused handle
-        self._load_catalog()
-        have_handle = False
-        while not have_handle:
-            self._arbitrary_waveform_n += 1
-            handle = "w%04d.wfm" % self._arbitrary_waveform_n
-            have_handle = handle not in self._catalog_names
-        self._write(":data:destination \"%s\"" % handle)
-        self._write(":wfmpre:bit_nr 12")
-        self._write(":wfmpre:bn_fmt rp")
-        self._write(":wfmpre:byt_nr 2")
-        self._write(":wfmpre:byt_or msb")
-        self._write(":wfmpre:encdg bin")
-        self._write(":wfmpre:pt_fmt y")
-        self._write(":wfmpre:yzero 0")
-        self._write(":wfmpre:ymult %e" % (2/(1<<12)))
-        self._write(":wfmpre:xincr %e" % xincr)
-        
-        raw_data = b''
+        # files are named after 8 digits of the key, the next 8 digits are
+        # used if the name holds a different waveform
+        cache = self._arbitrary_waveform_cache
+        for i in range(0, len(key), 8):
+            handle = "%s.wfm" % key[i:i+8]
+            if cache.get(handle) == handle:
+                # stored in an earlier session
+                if self._arbitrary_waveform_check(handle, len(raw_data) // 2, xincr):
+                    del cache[handle]
+                    self._arbitrary_waveform_cache_put(key, handle)
+                    return handle
+            elif handle not in self._catalog_names:
+                break
+        else:
+            raise fgen.NoWaveformsAvailableException()
         
-        for f in y:
-            # clip at -1 and 1
-            if f > 1.0: f = 1.0
-            if f < -1.0: f = -1.0
-            
-            f = (f + 1) / 2
+        self._arbitrary_waveform_cache_evict(len([n for n in self._catalog_names if n.endswith('.wfm')]))
+        while True:
+            self._write(":data:destination \"%s\"" % handle)
+            self._write(":wfmpre:bit_nr 12")
+            self._write(":wfmpre:bn_fmt rp")
+            self._write(":wfmpre:byt_nr 2")
+            self._write(":wfmpre:byt_or msb")
+            self._write(":wfmpre:encdg bin")
+            self._write(":wfmpre:pt_fmt y")
+            self._write(":wfmpre:yzero 0")
+            self._write(":wfmpre:ymult %e" % (2/(1<<12)))
+            self._write(":wfmpre:xincr %e" % xincr)
             
-            # scale to 12 bits
-            i = int(f * ((1 << 12) - 2) + 0.5) & 0x000fffff
+            self._write_ieee_block(raw_data, ':curve ')
             
-            # add to raw data, MSB first
-            raw_data = raw_data + struct.pack('>H', i)
+            # make room and try again if the waveform memory is full
+            if self._driver_operation_simulate or not self._arbitrary_waveform_memory_full():
+                break
+            if not self._arbitrary_waveform_cache_evict_one():
+                raise fgen.NoWaveformsAvailableException()
         
-        self._write_ieee_block(raw_data, ':curve ')
+        self._catalog_names.append(handle)
+        self._arbitrary_waveform_cache_put(key, handle)
         
         return handle
     
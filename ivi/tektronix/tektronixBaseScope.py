@@ -24,10 +24,11 @@ THE SOFTWARE.
 
 """
 
-import array
 import sys
 import time
 
+import numpy as np
+
 from .. import ivi
 from .. import scope
 from .. import scpi
@@ -214,6 +215,8 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
         self._display_screenshot_image_format_mapping = ScreenshotImageFormatMapping
         self._display_vectors = True
         self._display_labels = True
+        self._waveform_source = None
+        self._waveform_preamble = dict()
 
         self._identity_description = "Tektronix generic IVI oscilloscope driver"
         self._identity_identifier = ""
@@ -366,6 +369,9 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
                         or an empty string to clear the advisory line.
                         """))
 
+        self._cache_dependents.append((('timebase_', 'channel_', 'acquisition_', 'waveform_transfer'),
+                'waveform_preamble'))
+
         self._init_channels()
 
     def _initialize(self, resource = None, id_query = False, reset = False, **keywargs):
@@ -1049,7 +1055,9 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
         self._set_cache_valid(False, 'trigger_level')
 
     def _measurement_abort(self):
-        pass
+        if not self._driver_operation_simulate:
+            self._write(":acquire:state stop")
+            self._set_cache_valid(False, 'trigger_continuous')
 
     def _get_trigger_tv_trigger_event(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
@@ -1261,12 +1269,7 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
     def _set_trigger_ac_line_slope(self, value):
         self._set_trigger_edge_slope(value)
 
-    def _measurement_fetch_waveform(self, index):
-        index = ivi.get_index(self._channel_name, index)
-
-        if self._driver_operation_simulate:
-            return list()
-
+    def _measurement_fetch_waveform_setup(self):
         self._write(":wfmoutpre:encdg binary")
         if sys.byteorder == 'little':
             self._write(":wfmoutpre:byt_or lsb")
@@ -1275,38 +1278,122 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
         self._write(":wfmoutpre:byt_nr 2")
         self._write(":wfmoutpre:bn_fmt rp")
         self._write(":wfmoutpre:pt_fmt y")
-        self._write(":data:source %s" % self._channel_name[index])
         self._write(":data:start 1")
         self._write(":data:stop 1e10")
 
-        # Read preamble
-
+    def _measurement_fetch_waveform_read_preamble(self, allow_min_max=False):
         pre = self._ask(":wfmoutpre?").split(';')
 
-        format = pre[7].strip()
-        points = int(pre[6])
-        xincr = float(pre[10])
-        xzero = float(pre[11])
-        ymult = float(pre[14])
-        yoff = float(pre[15])
-        yzero = int(float(pre[16]))
+        pre = {
+            'format': pre[7].strip(),
+            'points': int(pre[6]),
+            'x_increment': float(pre[10]),
+            'x_zero': float(pre[11]),
+            'y_multiplier': float(pre[14]),
+            'y_offset': float(pre[15]),
+            'y_zero': float(pre[16])}
+
+        # peak detect and envelope records are transmitted as min/max pairs
+        pre['min_max'] = pre['format'] == 'ENV'
 
-        if type == 1:
+        if pre['min_max'] and not allow_min_max:
             raise scope.InvalidAcquisitionTypeException()
 
-        if format != 'Y':
-            raise UnexpectedResponseException()
+        if pre['format'] not in ('Y', 'ENV'):
+            raise ivi.UnexpectedResponseException()
+
+        return pre
+
+    def _measurement_fetch_waveform_prepare(self):
+        # transfer setup, source and preambles are cached; preambles are
+        # invalidated by timebase, channel and acquisition changes
+        if not self._get_cache_valid('waveform_transfer'):
+            self._measurement_fetch_waveform_setup()
+            self._set_cache_valid(True, 'waveform_transfer')
+
+        if not self._get_cache_valid('waveform_preamble'):
+            self._waveform_preamble = dict()
+            self._set_cache_valid(True, 'waveform_preamble')
+
+    def _measurement_fetch_waveform_preamble(self, index):
+        self._measurement_fetch_waveform_prepare()
+
+        if not self._get_cache_valid('waveform_source') or self._waveform_source != index:
+            self._write(":data:source %s" % self._channel_name[index])
+            self._waveform_source = index
+            self._set_cache_valid(True, 'waveform_source')
+
+        # Read preamble
+
+        pre = self._waveform_preamble.get(index)
+        if pre is None:
+            pre = self._measurement_fetch_waveform_read_preamble()
+            self._waveform_preamble[index] = pre
+
+        return pre
+
+    def _measurement_fetch_waveform_raw(self, index):
+        index = ivi.get_index(self._channel_name, index)
+
+        if self._driver_operation_simulate:
+            return ivi.RawWaveform(np.zeros(0, np.uint16))
+
+        pre = self._measurement_fetch_waveform_preamble(index)
 
         # Read waveform data
         raw_data = self._ask_for_ieee_block(":curve?")
-        self._read_raw() # flush buffer
 
-        # Split out points and convert to time and voltage pairs
-        y_data = array.array('H', raw_data)
+        return self._measurement_fetch_waveform_decode(raw_data, pre)
+
+    def _measurement_fetch_waveform_window(self, index, start=None, stop=None, units='points'):
+        index = ivi.get_index(self._channel_name, index)
+
+        if self._driver_operation_simulate:
+            return ivi.Waveform([])
+
+        pre = self._measurement_fetch_waveform_preamble(index)
+        first, last = scope.get_waveform_window(start, stop, units,
+                pre['x_zero'], pre['x_increment'], pre['points'])
+        if last == first:
+            return ivi.Waveform(np.zeros(0), pre['x_zero'] + first * pre['x_increment'], pre['x_increment'], pre)
+
+        # data:start and data:stop are one based and inclusive
+        raw_data = self._ask_for_ieee_block(":data:start %d;:data:stop %d;:curve?" % (first + 1, last))
+        # the next full fetch restores the transfer range
+        self._set_cache_valid(False, 'waveform_transfer')
+
+        raw = self._measurement_fetch_waveform_decode(raw_data, pre)
+        raw.x_origin += first * raw.x_increment
+        return raw.to_waveform()
+
+    def _measurement_fetch_waveform_decode(self, raw_data, pre):
+        y_data = np.frombuffer(raw_data, np.uint16, len(raw_data) // 2)
+
+        return ivi.RawWaveform(y_data, pre['y_multiplier'], pre['y_zero'], pre['y_offset'], None,
+                pre['x_increment'], pre['x_zero'], 0, pre)
+
+    def _measurement_fetch_waveform(self, index):
+        return self._measurement_fetch_waveform_raw(index).to_waveform()
+
+    def _measurement_fetch_waveform_records(self, channels):
+        channels = [ivi.get_index(self._channel_name, index) for index in channels]
 
-        data = [((i * xincr) + xzero, ((y - yoff) * ymult) + yzero) for i, y in enumerate(y_data)]
+        if self._driver_operation_simulate:
+            return [self._measurement_fetch_waveform_raw(index) for index in channels]
+
+        # the preamble response is itself ';' separated and cannot share a
+        # program message, so preambles come through the cached path
+        pres = [self._measurement_fetch_waveform_preamble(index) for index in channels]
 
-        return data
+        # curve? returns one block per source when given a source list
+        self._write(":data:source %s;:curve?" % ','.join(self._channel_name[index] for index in channels))
+        blocks = self._read_response()
+        if len(blocks) != len(channels):
+            raise ivi.UnexpectedResponseException()
+        self._set_cache_valid(False, 'waveform_source')
+
+        return [self._measurement_fetch_waveform_decode(ivi.decode_ieee_block(block), pre)
+                for block, pre in zip(blocks, pres)]
 
     def _measurement_read_waveform(self, index, maximum_time):
         return self._measurement_fetch_waveform(index)
@@ -1317,6 +1404,11 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
             self._write(":acquire:state run")
             self._set_cache_valid(False, 'trigger_continuous')
 
+    def _measurement_stream_wait(self):
+        if not self._driver_operation_simulate:
+            # completes when the single sequence has been acquired
+            self._ask("*opc?")
+
     def _get_reference_level_high(self):
         if not self._driver_operation_simulate and not self._get_cache_valid():
             self._reference_level_high = float(self._ask(":measurement:reflevel:percent:high?"))
@@ -1396,10 +1488,31 @@ class tektronixBaseScope(scpi.common.IdnCommand, scpi.common.Reset, scpi.common.
     def _set_acquisition_number_of_envelopes(self, value):
         self._acquisition_number_of_envelopes = value
 
-    def _measurement_fetch_waveform_min_max(self, index):
+    def _measurement_fetch_waveform_min_max(self, index, bins=1000):
         index = ivi.get_index(self._channel_name, index)
-        data = list()
-        return data
+
+        if self._driver_operation_simulate:
+            return ivi.Envelope([], [])
+
+        self._measurement_fetch_waveform_prepare()
+
+        if not self._get_cache_valid('waveform_source') or self._waveform_source != index:
+            self._write(":data:source %s" % self._channel_name[index])
+            self._waveform_source = index
+            self._set_cache_valid(True, 'waveform_source')
+
+        # always read the preamble, min/max preambles are not cached
+        pre = self._measurement_fetch_waveform_read_preamble(True)
+        raw_data = self._ask_for_ieee_block(":curve?")
+        wfm = self._measurement_fetch_waveform_decode(raw_data, pre).to_waveform()
+
+        if pre['min_max']:
+            y = wfm.y[:len(wfm) & ~1]
+            return ivi.Envelope(np.fmin(y[0::2], y[1::2]), np.fmax(y[0::2], y[1::2]),
+                    wfm.x_origin, wfm.x_increment * 2, pre).envelope(bins)
+
+        # reduce a normal record on the host
+        return wfm.envelope(bins)
 
     def _measurement_read_waveform_min_max(self, index, maximum_time):
         return self._measurement_fetch_waveform_min_max(index)
@@ -45,49 +45,6 @@ class tektronixMDO4000(tektronixMSO4000):
 
         self._init_channels()
 
-    def _measurement_fetch_waveform(self, index):
-        index = ivi.get_index(self._channel_name, index)
-
-        if self._driver_operation_simulate:
-            return list()
-
-        self._write(":wfmoutpre:encdg binary")
-        if sys.byteorder == 'little':
-            self._write(":wfmoutpre:byt_or lsb")
-        else:
-            self._write(":wfmoutpre:byt_or msb")
-        self._write(":wfmoutpre:byt_nr 2")
-        self._write(":wfmoutpre:bn_fmt rp")
-        self._write(":wfmoutpre:pt_fmt y")
+    def _measurement_fetch_waveform_setup(self):
+        super(tektronixMDO4000, self)._measurement_fetch_waveform_setup()
         self._write(":wfmoutpre:domain time")
-        self._write(":data:source %s" % self._channel_name[index])
-        self._write(":data:start 1")
-        self._write(":data:stop 1e10")
-
-        # Read preamble
-
-        pre = self._ask(":wfmoutpre?").split(';')
-
-        format = pre[7].strip()
-        points = int(pre[6])
-        xincr = float(pre[10])
-        xzero = float(pre[11])
-        ymult = float(pre[14])
-        yoff = float(pre[15])
-        yzero = int(float(pre[16]))
-
-        if type == 1:
-            raise scope.InvalidAcquisitionTypeException()
-
-        if format != 'Y':
-            raise UnexpectedResponseException()
-
-        # Read waveform data
-        raw_data = self._ask_for_ieee_block(":curve?")
-
-        # Split out points and convert to time and voltage pairs
-        y_data = array.array('H', raw_data)
-
-        data = [((i * xincr) + xzero, ((y - yoff) * ymult) + yzero) for i, y in enumerate(y_data)]
-
-        return data
@@ -24,9 +24,6 @@ THE SOFTWARE.
 
 """
 
-import numpy as np
-import struct
-
 from .. import ivi
 from .. import fgen
 
@@ -72,6 +69,7 @@ class tektronixMDOAFG(fgen.Base, fgen.StdFunc, fgen.ArbWfm, fgen.ArbFrequency,
         self._arbitrary_waveform_size_max = 131072
         self._arbitrary_waveform_size_min = 2
         self._arbitrary_waveform_quantum = 1
+        self._arbitrary_waveform_sample_format = ('<f4', None)
 
         self._add_property('outputs[].standard_waveform.pulse_width',
                         self._get_output_standard_waveform_pulse_width,
@@ -488,30 +486,7 @@ class tektronixMDOAFG(fgen.Base, fgen.StdFunc, fgen.ArbWfm, fgen.ArbFrequency,
         self._set_output_standard_waveform_frequency(index, value)
 
     def _arbitrary_waveform_create_channel_waveform(self, index, data):
-        y = None
-        x = None
-        if type(data) == list and type(data[0]) == float:
-            # list
-            y = array(data)
-        elif type(data) == np.ndarray and len(data.shape) == 1:
-            # 1D array
-            y = data
-        elif type(data) == np.ndarray and len(data.shape) == 2 and data.shape[0] == 1:
-            # 2D array, hieght 1
-            y = data[0]
-        elif type(data) == np.ndarray and len(data.shape) == 2 and data.shape[1] == 1:
-            # 2D array, width 1
-            y = data[:,0]
-        else:
-            x, y = ivi.get_sig(data)
-
-        if len(y) % self._arbitrary_waveform_quantum != 0:
-            raise ivi.ValueNotSupportedException()
-
-        # clip on [-1,1]
-        yc = y.clip(-1, 1)
-
-        raw_data = yc.astype('<f').tobytes()
+        x, raw_data = self._arbitrary_waveform_encode(data)
 
         self._write(':%s:arbitrary:emem:points:encdg binary' % self._output_name[index])
         self._write_ieee_block(raw_data, ':%s:arbitrary:emem:points ' % self._output_name[index])
@@ -0,0 +1,208 @@
+"""
+
+Python Interchangeable Virtual Instrument Library
+
+Copyright (c) 2016 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Micro-benchmarks for driver internals; run with python -m ivi.test.bench_ivi
+
+"""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import timeit
+
+import ivi
+
+def bench(name, stmt, number=10000):
+    t = min(timeit.repeat(stmt, number=number, repeat=3)) / number
+    print("%-40s %10.3f us" % (name, t * 1e6))
+    return t
+
+def bench_import(stmt="import ivi", repeat=5):
+    "Import time in a fresh interpreter"
+    path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = ("import sys, time; sys.path.insert(0, %r); t = time.time(); %s; "
+        "print(time.time() - t)" % (path, stmt))
+    t = min(float(subprocess.check_output([sys.executable, '-c', code])) for i in range(repeat))
+    print("%-40s %10.3f ms" % (stmt, t * 1e3))
+    return t
+
+def bench_cached_read():
+    "Cached property read on a scope channel (no instrument I/O)"
+    from ivi.agilent import agilentMSO7104A
+    scope = agilentMSO7104A()
+    scope._initialized = True
+    scope._set_cache_valid(True, 'channel_range', 0)
+    ch = scope.channels[0]
+    bench("cached read channels[0].range", lambda: ch.range)
+    bench("cached read _get_channel_range(0)", lambda: scope._get_channel_range(0))
+    bench("_get_cache_valid() implicit tag", lambda: scope._get_cache_valid(index=0))
+    bench("_get_cache_valid() explicit tag", lambda: scope._get_cache_valid('channel_range', 0))
+
+def bench_attribute_access():
+    "Attribute access through the property tree"
+    from ivi.agilent import agilentMSO7104A
+    scope = agilentMSO7104A()
+    bench("method lookup trigger.configure", lambda: scope.trigger.configure)
+    bench("internal attribute _channel_count", lambda: scope._channel_count)
+    bench("property driver_operation.cache", lambda: scope.driver_operation.cache)
+
+def bench_decode_values(n=50000):
+    "Numeric response decoding"
+    import numpy as np
+    values = np.random.uniform(-1, 1, n)
+    s = ','.join('%+.9E' % v for v in values)
+    b = values.astype('>f8').tobytes()
+    bench("map(float) %d ascii values" % n, lambda: np.array(list(map(float, s.split(',')))), number=20)
+    bench("decode_ascii_values %d values" % n, lambda: ivi.decode_ascii_values(s), number=20)
+    bench("decode_binary_values %d real,64" % n, lambda: ivi.decode_binary_values(b, 'real,64'), number=20)
+
+def bench_read_ieee_block(n=1 << 24):
+    "IEEE block transfer from an in-memory instrument"
+    import io
+    block = ivi.build_ieee_block(b'\0' * n) + b'\n'
+    class Instrument(object):
+        def write_raw(self, data):
+            self.buffer = io.BytesIO(block)
+        def read_raw(self, num=-1):
+            return self.buffer.read(num)
+    drv = ivi.Driver(Instrument())
+    bench("_ask_for_ieee_block %d MiB" % (n >> 20), lambda: drv._ask_for_ieee_block(":waveform:data?"), number=10)
+
+def bench_write_ieee_block(n=1 << 24):
+    "IEEE block upload of a numpy array to an instrument that discards data"
+    import numpy as np
+    class Instrument(object):
+        def write_raw(self, data):
+            pass
+        def read_raw(self, num=-1):
+            return b''
+    drv = ivi.Driver(Instrument())
+    data = np.zeros(n // 2, dtype='>i2')
+    bench("_write_ieee_block %d MiB" % (n >> 20), lambda: drv._write_ieee_block(data, ':curve '), number=10)
+
+class WaveformInstrument(object):
+    """Instrument answering queries by suffix, every other query reads 0
+    
+    A source list makes every query answer once per listed source."""
+    def __init__(self, responses):
+        import io
+        self.responses = responses
+        self.buffer = io.BytesIO()
+        self.sources = 1
+    def write_raw(self, data):
+        import io
+        resp = list()
+        for msg in data.decode('latin-1').lower().split(';'):
+            if 'source' in msg:
+                self.sources = msg.count(',') + 1
+            for k in self.responses:
+                if msg.endswith(k):
+                    resp.extend([self.responses[k]] * self.sources)
+                    break
+            else:
+                if msg.endswith('?'):
+                    resp.append(b'0')
+        if resp:
+            self.buffer = io.BytesIO(b';'.join(resp) + b'\n')
+    def read_raw(self, num=-1):
+        return self.buffer.read(num)
+
+def bench_fetch_waveform(n=1000000, channels=1):
+    "Waveform transfer and decode per vendor, in-memory instrument"
+    import numpy as np
+    data = ivi.build_ieee_block(np.random.randint(1, 30000, n).astype(np.uint16).tobytes())
+    be_data = ivi.build_ieee_block(np.random.randint(1, 30000, n).astype('>i2').tobytes())
+    tek_pre = ['0'] * 17
+    tek_pre[6] = str(n)
+    tek_pre[7] = 'Y'
+    tek_pre[10] = '1.0E-9'
+    tek_pre[14] = '1.0E-3'
+    # the descriptor comes back as one quoted string with embedded line breaks
+    lecroy_pre = ('"\r\nCOMM_TYPE : word\r\nPNTS_PER_SCREEN : %d\r\nHORIZ_INTERVAL : 1e-9\r\n'
+        'HORIZ_OFFSET : 0\r\nVERTICAL_GAIN : 1e-3\r\nVERTICAL_OFFSET : 0\r\n"' % n)
+    drivers = [
+        ('agilent', 'agilentMSO7104A', {
+            'preamble?': ('1,0,%d,1,1.0E-9,0,0,1.0E-3,0,32768' % n).encode(),
+            'data?': data}),
+        ('agilent', 'agilentDSOX92004A', {
+            'preamble?': ('2,0,%d,1,1.0E-9,0,0,1.0E-3,0,0' % n).encode(),
+            'data?': data}),
+        ('tektronix', 'tektronixMSO4104', {
+            'wfmoutpre?': ';'.join(tek_pre).encode(),
+            'curve?': data}),
+        ('lecroy', 'lecroyWR104XIA', {
+            'wavedesc': lecroy_pre.encode(),
+            'dat1': be_data})]
+    for pkg, name, responses in drivers:
+        drv = getattr(getattr(ivi, pkg), name)(WaveformInstrument(responses))
+        bench("fetch_waveform %s %dk points" % (name, n // 1000), lambda: drv.channels[0].measurement.fetch_waveform(), number=5)
+        if channels > 1:
+            bench("fetch_waveform x%d %s %dk points" % (channels, name, n // 1000),
+                lambda: [drv.channels[i].measurement.fetch_waveform() for i in range(channels)], number=5)
+            bench("fetch_waveforms x%d %s %dk points" % (channels, name, n // 1000),
+                lambda: drv.measurement.fetch_waveforms(range(channels)), number=5)
+
+def bench_envelope(n=1000000, bins=1000):
+    "Min/max reduction of a record on the host"
+    import numpy as np
+    wfm = ivi.Waveform(np.random.standard_normal(n))
+    bench("envelope %dk points to %d bins" % (n // 1000, bins), lambda: wfm.envelope(bins), number=10)
+
+def bench_encode_arbitrary_waveform(n=256 * 1024):
+    "Arbitrary waveform sample encoding for upload"
+    import numpy as np
+    from ivi import fgen
+    y = np.sin(np.linspace(0, 2 * np.pi, n))
+    bench("encode arbitrary waveform %dk points >u2/12" % (n // 1024),
+        lambda: fgen.encode_arbitrary_waveform(y, '>u2', 12), number=20)
+
+def bench_find_peaks(n=100000, excursion=3.0):
+    "Host-side peak search on a spectrum analyzer trace"
+    import numpy as np
+    from ivi import specan
+    y = np.random.standard_normal(n)
+    bench("find_peaks %dk points excursion %g" % (n // 1000, excursion),
+        lambda: specan.find_peaks(y, excursion), number=20)
+
+def bench_construct():
+    "Driver construction"
+    from ivi.agilent import agilentMSO7104A
+    bench("construct agilentMSO7104A", agilentMSO7104A, number=20)
+
+if __name__ == '__main__':
+    bench_import()
+    bench_import("import ivi; ivi.agilent.agilentDSOX3034A")
+    bench_construct()
+    bench_cached_read()
+    bench_attribute_access()
+    bench_decode_values()
+    bench_read_ieee_block()
+    bench_write_ieee_block()
+    bench_fetch_waveform()
+    bench_fetch_waveform(250000, 4)
+    bench_envelope()
+    bench_encode_arbitrary_waveform()
+    bench_find_peaks()
@@ -24,9 +24,20 @@ THE SOFTWARE.
 
 """
 
+import io
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
 import unittest
 
+import numpy as np
+
 import ivi
+from ivi import scope
+from ivi import specan
 
 class TestIndex(unittest.TestCase):
 
@@ -57,5 +68,1003 @@ class TestIndex(unittest.TestCase):
         self.assertRaises(ivi.SelectorRangeException, ivi.get_index, self.index_dict, 100);
         self.assertRaises(ivi.SelectorNameException, ivi.get_index, self.index_dict, 'bad_item');
 
+class TestDoc(unittest.TestCase):
+
+    def test_doc(self):
+        raw = """
+            First line
+            
+              indented
+            """
+        d = ivi.Doc(raw, 'IviScope', 'Base', '4.2.1')
+        self.assertEqual(d.raw_doc, raw)
+        self.assertEqual(d.doc, 'First line\n\n  indented')
+        self.assertEqual(str(d), d.doc)
+        self.assertTrue(d.doc is d.doc)
+        d.name = 'acquisition.start_time'
+        self.assertEqual(d.render(), '.. attribute:: acquisition.start_time\n\n'
+            '   *IVI class IviScope, capability group IviScopeBase, section 4.2.1*\n\n'
+            '   First line\n   \n     indented\n')
+
+    def test_shared_per_class(self):
+        from ivi.agilent import agilentMSO7104A
+        a = agilentMSO7104A()
+        b = agilentMSO7104A()
+        self.assertTrue(a.channels._docs['range'] is b.channels._docs['range'])
+        self.assertTrue(a._docs['initialize'] is b._docs['initialize'])
+        self.assertEqual(a.channels._docs['range'].name, 'channels[].range')
+
+class TestPropertyCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.value = 1
+        self.obj = ivi.PropertyCollection()
+        self.obj._add_property('value', self._get_value, self._set_value)
+        self.obj._add_property('readonly', self._get_value)
+        self.obj._add_method('method', self._get_value)
+        self.obj._lock()
+
+    def _get_value(self):
+        return self.value
+
+    def _set_value(self, value):
+        self.value = value
+
+    def test_property(self):
+        self.assertEqual(self.obj.value, 1)
+        self.obj.value = 2
+        self.assertEqual(self.value, 2)
+        self.assertEqual(self.obj.readonly, 2)
+        self.assertRaises(AttributeError, setattr, self.obj, 'readonly', 3)
+        self.assertRaises(AttributeError, delattr, self.obj, 'value')
+
+    def test_method(self):
+        self.assertEqual(self.obj.method(), 1)
+
+    def test_per_instance(self):
+        other = ivi.PropertyCollection()
+        other.value = 5
+        self.assertEqual(other.value, 5)
+        self.assertEqual(self.obj.value, 1)
+        other._add_property('value', lambda: 6)
+        self.assertEqual(other.value, 6)
+        self.assertEqual(self.obj.value, 1)
+
+    def test_per_node_class(self):
+        # descriptors live on a class of the node's own
+        other = ivi.PropertyCollection()
+        self.assertFalse('readonly' in dir(other))
+        self.assertFalse(hasattr(ivi.PropertyCollection, 'value'))
+        self.assertTrue(isinstance(self.obj, ivi.PropertyCollection))
+        other._add_method('value', lambda: 7)
+        self.assertEqual(other.value(), 7)
+        self.assertEqual(self.obj.value, 1)
+
+    def test_lock(self):
+        self.assertRaises(AttributeError, setattr, self.obj, 'unmanaged', 1)
+        self.obj._unlock()
+        self.obj.unmanaged = 1
+        self.assertEqual(self.obj.unmanaged, 1)
+
+class TestIndexedPropertyCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.values = [10, 11, 12, 13]
+        self.obj = ivi.IndexedPropertyCollection()
+        self.obj._add_property('value', self._get_value, self._set_value)
+        self.obj._add_method('sub.method', self._get_value)
+        self.obj._set_list(['ch1', 'ch2', 'ch3', 'ch4'])
+
+    def _get_value(self, index):
+        return self.values[index]
+
+    def _set_value(self, index, value):
+        self.values[index] = value
+
+    def test_lazy_build(self):
+        self.assertEqual(self.obj._objs, [None] * 4)
+        self.assertEqual(self.obj[1].value, 11)
+        self.assertTrue(self.obj[1] is self.obj['ch2'])
+        self.assertEqual(self.obj._objs.count(None), 3)
+
+    def test_index(self):
+        self.obj['ch3'].value = 20
+        self.assertEqual(self.values[2], 20)
+        self.assertEqual(self.obj[3].sub.method(), 13)
+        self.assertRaises(ivi.SelectorRangeException, self.obj.__getitem__, 4)
+        self.assertRaises(ivi.SelectorNameException, self.obj.__getitem__, 'ch5')
+
+    def test_len_iter_slice(self):
+        self.assertEqual(len(self.obj), 4)
+        self.assertEqual(self.obj.count(), 4)
+        self.assertEqual([o.value for o in self.obj], self.values)
+        self.assertEqual([o.value for o in self.obj[1:3]], [11, 12])
+        self.assertEqual([o.value for o in self.obj[::-1]], self.values[::-1])
+        self.assertEqual(self.obj[5:], [])
+
+class CacheDriver(ivi.Driver):
+
+    def _get_channel_range(self, index):
+        return self._get_cache_valid(index=index)
+
+    def _set_channel_range(self, index, value):
+        self._set_cache_valid(value, index=index)
+        # nested getters use their own tag
+        self._get_trigger_level()
+
+    def _get_trigger_level(self):
+        return self._get_cache_valid()
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.drv = CacheDriver()
+
+    def _get_channel_range(self, index):
+        return self.drv._get_channel_range(index)
+
+    def _set_channel_range(self, index, value):
+        self.drv._set_channel_range(index, value)
+
+    def test_get_cache_tag(self):
+        self.assertEqual(ivi.get_cache_tag('_get_channel_range'), 'channel_range')
+        self.assertEqual(ivi.get_cache_tag('_set_channel_range'), 'channel_range')
+        self.assertEqual(ivi.get_cache_tag('_channel_range'), 'channel_range')
+        self.assertEqual(ivi.get_cache_tag('channel_range'), 'channel_range')
+
+    def test_implicit_tag(self):
+        self.assertFalse(self._get_channel_range(1))
+        self._set_channel_range(1, True)
+        self.assertTrue(self._get_channel_range(1))
+        self.assertFalse(self._get_channel_range(0))
+        self.assertTrue(self.drv._get_cache_valid('channel_range', 1))
+        self.assertTrue(self.drv._cache_valid['channel_range_1'])
+        self.assertFalse(self.drv._cache_valid['trigger_level'])
+        # the tag is bound when the class is first instantiated, not looked up per call
+        self.assertEqual(CacheDriver.__dict__['_get_channel_range']._cache_tag, 'channel_range')
+        self.assertEqual(self.drv._cache_context.tag, None)
+
+    def test_explicit_tag(self):
+        self.drv._set_cache_valid(True, 'timebase_scale')
+        self.assertTrue(self.drv._get_cache_valid('timebase_scale'))
+        self.assertTrue(self.drv._get_cache_valid('_get_timebase_scale'))
+        self.drv._set_cache_valid(False, '_set_timebase_scale')
+        self.assertFalse(self.drv._get_cache_valid('timebase_scale'))
+
+    def test_dependents(self):
+        self.drv._cache_dependents.append((('timebase_', 'channel_'), 'waveform_preamble'))
+        self.drv._set_cache_valid(True, 'waveform_preamble')
+        self.drv._set_cache_valid(True, 'trigger_level')
+        self.assertTrue(self.drv._get_cache_valid('waveform_preamble'))
+        self._set_channel_range(2, True)
+        self.assertFalse(self.drv._get_cache_valid('waveform_preamble'))
+        self.drv._set_cache_valid(True, 'waveform_preamble')
+        self.drv._set_cache_valid(False, 'timebase_scale')
+        self.assertFalse(self.drv._get_cache_valid('waveform_preamble'))
+
+    def test_cache_disabled(self):
+        self._set_channel_range(0, True)
+        self.drv.driver_operation.cache = False
+        self.assertFalse(self._get_channel_range(0))
+        self.assertTrue(self.drv._get_cache_valid('channel_range', 0, skip_disable=True))
+        self.drv.driver_operation.invalidate_all_attributes()
+        self.assertFalse(self.drv._get_cache_valid('channel_range', 0, skip_disable=True))
+
+class VirtualInstrument(object):
+    "Records every message and answers queries from a table"
+    def __init__(self, responses=None):
+        self.responses = responses or dict()
+        self.rx_log = list()
+        self.read_buffer = io.BytesIO()
+
+    def write_raw(self, data):
+        self.rx_log.append(data)
+        resp = list()
+        for msg in data.decode('latin-1').split(';'):
+            msg = msg.lstrip(':').lower()
+            if msg.split(' ', 1)[0].endswith('?'):
+                resp.append(self.responses.get(msg, b''))
+        if resp:
+            self.read_buffer = io.BytesIO(b';'.join(resp) + b'\n')
+
+    def read_raw(self, num=-1):
+        return self.read_buffer.read(num)
+
+class ChunkedInstrument(VirtualInstrument):
+    "Returns short reads that end at a newline, like linux-gpib and serial ports"
+    def __init__(self, responses=None, chunk=16):
+        super(ChunkedInstrument, self).__init__(responses)
+        self.chunk = chunk
+
+    def write_raw(self, data):
+        super(ChunkedInstrument, self).write_raw(data)
+
+    def read_raw(self, num=-1):
+        num = self.chunk if num < 0 else min(num, self.chunk)
+        data = b''
+        while len(data) < num:
+            c = self.read_buffer.read(1)
+            data += c
+            if c in (b'', b'\n'):
+                break
+        return data
+
+
+class TestWriteBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.inst = VirtualInstrument({'chan1:range?': b'+1.0E+00'})
+        self.drv = ivi.Driver(self.inst)
+
+    def test_no_batch(self):
+        self.drv._write(':chan1:range 1')
+        self.drv._write('chan1:offs 0')
+        self.assertEqual(self.inst.rx_log, [b':chan1:range 1', b'chan1:offs 0'])
+
+    def test_batch(self):
+        with self.drv.driver_operation.batch():
+            self.drv._write(':chan1:range 1')
+            self.drv._write(['chan1:offs 0', '*cls'])
+            self.assertEqual(self.inst.rx_log, [])
+        self.assertEqual(self.inst.rx_log, [b':chan1:range 1;:chan1:offs 0;*cls'])
+
+    def test_batch_query(self):
+        with self.drv.driver_operation.batch():
+            self.drv._write(':chan1:offs 0')
+            self.assertEqual(self.drv._ask('chan1:range?'), '+1.0E+00')
+            self.drv._write(':chan1:offs 1')
+        self.assertEqual(self.inst.rx_log, [b':chan1:offs 0;:chan1:range?', b':chan1:offs 1'])
+
+    def test_batch_raw(self):
+        with self.drv.driver_operation.batch():
+            self.drv._write(':chan1:offs 0')
+            self.drv._write_raw(b':data #11x')
+        self.assertEqual(self.inst.rx_log, [b':chan1:offs 0', b':data #11x'])
+
+    def test_batch_dialect(self):
+        with self.drv.driver_operation.batch():
+            self.drv._write(['tdf a', 'mds w'])
+        with self.drv.driver_operation.batch():
+            self.drv._write(['chan1:offs 0', '*cls', 'offs 1', 'run'])
+        self.assertEqual(self.inst.rx_log, [b'tdf a;mds w', b'chan1:offs 0;*cls;:offs 1;run'])
+
+    def test_batch_error(self):
+        def body():
+            with self.drv.driver_operation.batch():
+                self.drv._write(':chan1:offs 0')
+                raise ivi.ValueNotSupportedException()
+        self.assertRaises(ivi.ValueNotSupportedException, body)
+        self.assertEqual(self.inst.rx_log, [])
+        self.assertEqual(self.drv._write_batch, None)
+        self.drv._write(':chan1:offs 1')
+        self.assertEqual(self.inst.rx_log, [b':chan1:offs 1'])
+
+    def test_batch_nested_error(self):
+        with self.drv.driver_operation.batch():
+            self.drv._write(':a 1')
+            try:
+                with self.drv.driver_operation.batch():
+                    self.drv._write(':b 1')
+                    raise ivi.ValueNotSupportedException()
+            except ivi.ValueNotSupportedException:
+                pass
+            self.drv._write(':c 1')
+        self.assertEqual(self.inst.rx_log, [b':a 1;:c 1'])
+
+    def test_batch_error_cache(self):
+        from ivi.agilent import agilent34401A
+        inst = VirtualInstrument({'trigger:delay?': b'+8.0E+00'})
+        drv = agilent34401A(inst)
+        self.assertEqual(drv.trigger.delay, 8.0)
+        def body():
+            with drv.driver_operation.batch():
+                drv.trigger.delay = 5.0
+                raise ivi.ValueNotSupportedException()
+        self.assertRaises(ivi.ValueNotSupportedException, body)
+        # nothing was written, the value is read back from the instrument
+        self.assertFalse(any(b'delay 5' in m for m in inst.rx_log))
+        self.assertEqual(drv.trigger.delay, 8.0)
+
+    def test_batch_size(self):
+        self.drv.driver_operation.batch_size = 30
+        with self.drv.driver_operation.batch():
+            with self.drv.driver_operation.batch():
+                for i in range(4):
+                    self.drv._write(':chan%d:offs 0' % (i+1))
+            self.assertEqual(self.inst.rx_log, [b':chan1:offs 0;:chan2:offs 0'])
+        self.assertEqual(self.inst.rx_log, [b':chan1:offs 0;:chan2:offs 0',
+            b':chan3:offs 0;:chan4:offs 0'])
+
+class TestMultipleQuery(unittest.TestCase):
+
+    def test_split_response(self):
+        self.assertEqual(ivi.split_response(b'1;2.5;ON'), [b'1', b'2.5', b'ON'])
+        self.assertEqual(ivi.split_response(b'"a;b";\'c;\'\'d\';"e""f;"'),
+            [b'"a;b"', b"'c;''d'", b'"e""f;"'])
+        self.assertEqual(ivi.split_response(b'#14a;b;;1;#13;;;'), [b'#14a;b;', b'1', b'#13;;;'])
+        self.assertEqual(ivi.split_response(b'1;#0a;b;c'), [b'1', b'#0a;b;c'])
+        self.assertEqual(ivi.split_response(b'#H1F;2'), [b'#H1F', b'2'])
+        self.assertEqual(ivi.split_response(b''), [b''])
+
+    def test_ask_multiple(self):
+        inst = VirtualInstrument({
+            'chan1:range?': b'+1.0E+00',
+            'chan1:coupling?': b'DC',
+            'system:setup?': b'#15ab;\n\r',
+            'chan1:label?': b'A;B'})
+        drv = ivi.Driver(inst)
+        self.assertEqual(drv._ask_multiple([':chan1:range?', 'chan1:coupling?', 'system:setup?']),
+            ['+1.0E+00', 'DC', b'ab;\n\r'])
+        self.assertEqual(inst.rx_log, [b':chan1:range?;:chan1:coupling?;:system:setup?'])
+        self.assertEqual(drv._ask_multiple(['chan1:range?', 'chan1:coupling?'], [float, str.lower]),
+            [1.0, 'dc'])
+        self.assertEqual(drv._ask_multiple(['chan1:range?', 'chan1:range?'], float), [1.0, 1.0])
+        self.assertRaises(ivi.UnexpectedResponseException, drv._ask_multiple, ['chan1:range?', 'chan1:label?'])
+        del inst.rx_log[:]
+        self.assertEqual(drv._ask_multiple(['waveform:source chan1', 'chan1:range?', '*cls']), ['+1.0E+00'])
+        self.assertEqual(inst.rx_log, [b'waveform:source chan1;:chan1:range?;*cls'])
+        # only headers make queries, not a '?' in a string argument
+        self.assertEqual(drv._ask_multiple(['disp:text "a?b"', 'chan1:range?']), ['+1.0E+00'])
+
+    def test_ask_multiple_chunked(self):
+        payload = bytes(bytearray(range(256))) * 8
+        inst = ChunkedInstrument({
+            'chan1:label?': b'"a;\n""b"',
+            'curve?': b':CURVE ' + ivi.build_ieee_block(payload),
+            'data?': b'#0ab;cd'})
+        drv = ivi.Driver(inst)
+        self.assertEqual(drv._ask_multiple(['chan1:label?', 'curve?', 'chan1:label?']),
+            ['"a;\n""b"', payload, '"a;\n""b"'])
+        self.assertEqual(inst.read_buffer.read(), b'')
+        self.assertEqual(drv._ask_multiple(['curve?', 'data?']), [payload, b'ab;cd'])
+        self.assertEqual(inst.read_buffer.read(), b'')
+
+class TestAskForValues(unittest.TestCase):
+
+    def test_decode_ascii(self):
+        out = ivi.decode_ascii_values('+1.5E+00,-2.0E-03, 3\n')
+        self.assertEqual(out.dtype, np.float64)
+        self.assertEqual(out.tolist(), [1.5, -2.0e-3, 3.0])
+        self.assertEqual(ivi.decode_ascii_values('1;2', ';').tolist(), [1.0, 2.0])
+        self.assertEqual(ivi.decode_ascii_values('1,2', converter=int).tolist(), [1, 2])
+        self.assertEqual(len(ivi.decode_ascii_values('')), 0)
+        self.assertRaises(ValueError, ivi.decode_ascii_values, '1,a')
+
+    def test_decode_binary(self):
+        data = np.array([1.5, -2.0], dtype='>f8').tobytes()
+        self.assertEqual(ivi.decode_binary_values(data, 'REAL,64').tolist(), [1.5, -2.0])
+        data = np.array([1, -2], dtype='<i2').tobytes()
+        self.assertEqual(ivi.decode_binary_values(data, 'int,16', 'little').tolist(), [1, -2])
+        self.assertRaises(ivi.ValueNotSupportedException, ivi.decode_binary_values, data, 'real,16')
+
+    def test_ask_for_values(self):
+        data = np.array([1.5, -2.0, 3.0], dtype='>f4').tobytes()
+        inst = VirtualInstrument({
+            'fetch?': b'+1.5E+00,-2.0E+00,+3.0E+00',
+            'read?': ivi.build_ieee_block(data)})
+        drv = ivi.Driver(inst)
+        self.assertEqual(drv._ask_for_values(':fetch?').tolist(), [1.5, -2.0, 3.0])
+        self.assertEqual(drv._ask_for_values(':fetch?', array=False), [1.5, -2.0, 3.0])
+        self.assertEqual(drv._ask_for_values(':read?', format='real,32').tolist(), [1.5, -2.0, 3.0])
+        self.assertEqual(inst.read_buffer.read(), b'')
+
+    def test_dmm_data_format(self):
+        from ivi.agilent import agilent34461A
+        data = np.array([1.5, -2.0], dtype='>f8').tobytes()
+        inst = VirtualInstrument({
+            'fetch?': ivi.build_ieee_block(data),
+            'read?': ivi.build_ieee_block(data)})
+        drv = agilent34461A(inst)
+        self.assertEqual(list(drv.measurement.fetch_multi_point(1)), [1.5, -2.0])
+        self.assertTrue(b':format:data real,64' in inst.rx_log)
+        # single point measurements follow the selected data format
+        self.assertEqual(drv.measurement.fetch(1), 1.5)
+        self.assertEqual(drv.measurement.read(1), 1.5)
+        self.assertEqual(inst.read_buffer.read(), b'')
+        # the mixin's accessors use their own cache tag
+        self.assertTrue(drv._cache_valid.get('data_format'))
+        self.assertFalse('' in drv._cache_valid)
+        self.assertEqual(len([m for m in inst.rx_log if m.startswith(b':format:data')]), 1)
+
+class TestIeeeBlock(unittest.TestCase):
+
+    def setUp(self):
+        self.inst = VirtualInstrument()
+        self.drv = ivi.Driver(self.inst)
+
+    def test_read_block(self):
+        payload = bytes(bytearray(range(256))) * 20
+        self.inst.responses['curve?'] = b':CURVE ' + ivi.build_ieee_block(payload)
+        self.drv._ieee_block_chunk_size = 1000
+        data = self.drv._ask_for_ieee_block(':curve?')
+        self.assertEqual(data, payload)
+        self.assertEqual(np.frombuffer(data, 'u1')[-1], 255)
+        self.assertEqual(self.inst.read_buffer.read(), b'')
+
+    def test_read_short_block(self):
+        self.inst.responses['data?'] = b'#14ab\n\r'
+        self.assertEqual(self.drv._ask_for_ieee_block(':data?'), b'ab\n\r')
+        self.assertEqual(self.inst.read_buffer.read(), b'')
+
+    def test_read_indefinite_block(self):
+        self.inst.responses['data?'] = b'#0ab\ncd'
+        self.assertEqual(self.drv._ask_for_ieee_block(':data?'), b'ab\ncd')
+        self.assertEqual(self.inst.read_buffer.read(), b'')
+
+    def test_read_chunks(self):
+        payload = bytes(bytearray(range(256))) * 20
+        self.inst.responses['curve?'] = b':CURVE ' + ivi.build_ieee_block(payload)
+        chunks = list(self.drv._ask_for_ieee_block_chunks(':curve?', 1001, 4))
+        self.assertEqual(b''.join(chunks), payload)
+        self.assertTrue(all(len(c) % 4 == 0 and len(c) <= 1000 for c in chunks))
+        self.assertEqual(self.inst.read_buffer.read(), b'')
+        self.inst.responses['data?'] = b'#0abcde'
+        chunks = list(self.drv._ask_for_ieee_block_chunks(':data?', 2))
+        self.assertEqual([bytes(c) for c in chunks], [b'ab', b'cd', b'e'])
+
+    def test_build_block(self):
+        self.assertEqual(ivi.build_ieee_block(b'abc'), b'#13abc')
+        self.assertEqual(ivi.build_ieee_block(b''), b'#10')
+        self.assertEqual(ivi.build_ieee_block(b'a' * 12345)[:7], b'#512345')
+        self.assertEqual(ivi.build_ieee_block(np.array([1, 2], dtype='>i2'), b':curve '),
+            b':curve #14\x00\x01\x00\x02')
+        self.assertEqual(ivi.build_ieee_block(np.arange(4, dtype='u1')[::2]), b'#12\x00\x02')
+
+    def test_write_block(self):
+        self.drv._write_ieee_block(np.array([1, 2], dtype='u1'), ':data ')
+        self.drv._write_ieee_block(bytearray(b'ab'))
+        self.assertEqual(self.inst.rx_log, [b':data #12\x01\x02', b'#12ab'])
+
+    def test_read_truncated_block(self):
+        self.inst.responses['data?'] = b'#15ab'
+        self.assertRaises(ivi.UnexpectedResponseException, self.drv._ask_for_ieee_block, ':data?')
+
+class TestWaveform(unittest.TestCase):
+
+    def setUp(self):
+        raw = np.array([0, 100, 200, 300], dtype=np.uint16)
+        self.wfm = ivi.Waveform.from_raw(raw, 0.01, 1.0, 100, 0, 1e-3, 0.5, 2, {'points': 4})
+
+    def test_scaling(self):
+        self.assertTrue(np.isnan(self.wfm.y[0]))
+        self.assertEqual(self.wfm.y[1:].tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(self.wfm.preamble['points'], 4)
+
+    def test_x(self):
+        self.assertTrue(self.wfm._x is None)
+        self.assertTrue(np.allclose(self.wfm.x, [0.498, 0.499, 0.5, 0.501]))
+        self.assertTrue(self.wfm.x is self.wfm.x)
+
+    def test_pairs(self):
+        self.assertEqual(len(self.wfm), 4)
+        pairs = list(self.wfm)
+        self.assertEqual(len(pairs), 4)
+        self.assertAlmostEqual(pairs[2][0], 0.5)
+        self.assertEqual(pairs[2][1], 2.0)
+        self.assertAlmostEqual(self.wfm[-1][0], 0.501)
+        self.assertEqual(self.wfm[-1][1], 3.0)
+        self.assertRaises(IndexError, self.wfm.__getitem__, 4)
+        sub = self.wfm[1::2]
+        self.assertEqual(sub.y.tolist(), [1.0, 3.0])
+        self.assertTrue(np.allclose(sub.x, [0.499, 0.501]))
+        self.assertEqual(np.array(self.wfm).shape, (4, 2))
+
+    def test_raw(self):
+        raw = ivi.RawWaveform(np.array([0, 100, 200, 300, 400], dtype=np.int16),
+            0.01, 1.0, 100, 0, 1e-3, 0.5, 2)
+        self.assertEqual(len(raw), 5)
+        self.assertEqual(raw.data.dtype, np.int16)
+        wfm = raw.to_waveform()
+        self.assertTrue(np.isnan(wfm.y[0]))
+        self.assertEqual(wfm.y[1:].tolist(), [1.0, 2.0, 3.0, 4.0])
+        self.assertAlmostEqual(wfm.x_origin, 0.498)
+        chunks = list(raw.iter_chunks(2, np.float32))
+        self.assertEqual([len(c) for c in chunks], [2, 2, 1])
+        self.assertEqual(chunks[1].y.dtype, np.float32)
+        self.assertEqual(chunks[1].y.tolist(), [2.0, 3.0])
+        self.assertAlmostEqual(chunks[2].x[0], 0.502)
+
+    def test_stack(self):
+        raw = ivi.RawWaveform(np.array([0, 100, 200, 300, 400], dtype=np.int16),
+            0.01, 1.0, 100, 0, 1e-3, 0.5, 2, {'points': 5})
+        wfm = ivi.Waveform.stack([self.wfm, raw])
+        self.assertEqual(wfm.y.shape, (2, 4))
+        self.assertEqual(len(wfm), 4)
+        self.assertTrue(np.isnan(wfm.y[1][0]))
+        self.assertEqual(wfm.y[1][1:].tolist(), [1.0, 2.0, 3.0])
+        self.assertAlmostEqual(wfm.x_origin, 0.498)
+        self.assertEqual([p['points'] for p in wfm.preamble], [4, 5])
+        self.assertAlmostEqual(wfm[2][0], 0.5)
+        self.assertEqual(wfm[2][1], [2.0, 2.0])
+        self.assertEqual(wfm[1:3].y.shape, (2, 2))
+        self.assertEqual(np.array(wfm).shape, (4, 3))
+        self.assertEqual(ivi.Waveform.stack([]).y.shape, (0, 0))
+
+    def test_envelope(self):
+        wfm = ivi.Waveform([1.0, 5.0, np.nan, 2.0, 0.0, 3.0, -1.0], 0.5, 0.1)
+        env = wfm.envelope(3)
+        # the seventh sample is folded into the last bin, holes are ignored
+        self.assertEqual(env.y_min.tolist(), [1.0, 2.0, -1.0])
+        self.assertEqual(env.y_max.tolist(), [5.0, 2.0, 3.0])
+        self.assertAlmostEqual(env.x_increment, 0.2)
+        self.assertTrue(np.allclose(env.x, [0.5, 0.7, 0.9]))
+        self.assertEqual(len(list(env)), 3)
+        self.assertEqual(env[1][1:], (2.0, 2.0))
+        self.assertEqual(np.array(env).shape, (3, 3))
+        self.assertTrue(env.envelope(10) is env)
+        self.assertEqual(env.envelope(1).y_max.tolist(), [5.0])
+        self.assertEqual(len(wfm.envelope(100)), 7)
+        self.assertEqual(ivi.Waveform.stack([wfm, wfm]).envelope(2).y_min.shape, (2, 2))
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        from ivi.agilent import agilentMSO7104A
+        log = self.log = list()
+        class StreamScope(agilentMSO7104A):
+            def _measurement_stream_initiate(self, channels):
+                log.append('initiate')
+            def _measurement_stream_wait(self):
+                log.append('wait')
+            def _measurement_fetch_waveform_records(self, channels):
+                log.append('fetch')
+                if len(log) > 100:
+                    raise ivi.UnexpectedResponseException()
+                return [ivi.RawWaveform(np.arange(4) + log.count('fetch'), 2.0) for index in channels]
+            def _measurement_abort(self):
+                log.append('abort')
+        self.drv = StreamScope(simulate=True)
+
+    def test_count(self):
+        wfms = list(self.drv.measurement.stream([0, 1], 3))
+        self.assertEqual(len(wfms), 3)
+        self.assertEqual(wfms[2].y.shape, (2, 4))
+        self.assertEqual(wfms[2].y[1].tolist(), [6.0, 8.0, 10.0, 12.0])
+        # the next acquisition is armed before the records are handed over
+        self.assertEqual(self.log, ['initiate', 'wait', 'fetch'] * 3)
+
+    def test_close(self):
+        stream = self.drv.measurement.stream([0], None, 1)
+        self.assertEqual(next(stream).y[0].tolist(), [2.0, 4.0, 6.0, 8.0])
+        stream.close()
+        # every armed acquisition is either fetched or aborted
+        self.assertEqual(self.log.count('initiate'), self.log.count('fetch') + self.log.count('abort'))
+        n = len(self.log)
+        time.sleep(0.05)
+        self.assertEqual(len(self.log), n)
+        # backpressure: at most queue_size + 1 acquisitions ahead of the consumer
+        self.assertTrue(self.log.count('fetch') <= 3)
+
+    def test_close_waiting(self):
+        # the trigger never comes, the wait ends with an I/O timeout
+        threads = set()
+        def wait():
+            self.log.append('wait')
+            if self.log.count('wait') > 1:
+                time.sleep(0.2)
+                raise ivi.IOTimeoutException()
+        def abort():
+            threads.add(threading.current_thread())
+            self.log.append('abort')
+        self.drv._measurement_stream_wait = wait
+        self.drv._measurement_abort = abort
+        stream = self.drv.measurement.stream([0], None, 1)
+        next(stream)
+        stream.close()
+        # the abort runs on the background thread, which has exited
+        self.assertEqual(self.log.count('abort'), 1)
+        self.assertFalse(threading.current_thread() in threads)
+        self.assertEqual(self.log.count('initiate'), self.log.count('fetch') + self.log.count('abort'))
+
+    def test_close_timeout(self):
+        release = threading.Event()
+        self.drv._measurement_stream_wait = lambda: self.log.count('initiate') > 1 and release.wait(5)
+        self.drv._measurement_stream_timeout = 0.1
+        stream = self.drv.measurement.stream([0], None, 1)
+        next(stream)
+        self.assertRaises(ivi.OperationPendingException, stream.close)
+        release.set()
+
+    def test_error(self):
+        stream = self.drv.measurement.stream([0], None, 1000)
+        self.assertRaises(ivi.UnexpectedResponseException, list, stream)
+
+class TestSegments(unittest.TestCase):
+
+    def test_fetch_segments(self):
+        from ivi.agilent import agilentMSO7104A
+        data = np.array([1, 2, 3, 4], dtype=np.uint16)
+        inst = VirtualInstrument({
+            'waveform:segmented:count?': b'3',
+            'waveform:preamble?': b'1,0,4,1,1.0E-9,0,0,0.5,0,0',
+            'waveform:data?': ivi.build_ieee_block(data.tobytes()),
+            'waveform:segmented:ttag?': b'+2.0E-03'})
+        drv = agilentMSO7104A(inst)
+        del inst.rx_log[:]
+        wfm, time_tags = drv.channels[0].measurement.fetch_segments()
+        self.assertEqual(wfm.y.shape, (3, 4))
+        self.assertEqual(wfm.y[2].tolist(), [0.5, 1.0, 1.5, 2.0])
+        self.assertEqual(time_tags.tolist(), [2e-3] * 3)
+        # all segments in one exchange
+        self.assertEqual(inst.rx_log[-1].count(b':waveform:data?'), 3)
+        self.assertEqual(drv.acquisition.segmented.index, 3)
+
+class TestTransferFormat(unittest.TestCase):
+
+    def test_infiniivision(self):
+        from ivi.agilent import agilentMSO7104A
+        drv = agilentMSO7104A(simulate=True)
+        drv.waveform.format = 'byte'
+        drv.waveform.points_mode = 'raw'
+        drv.waveform.points = 1000
+        self.assertEqual(drv.channels[0].measurement.fetch_waveform_raw().data.dtype, np.uint8)
+
+    def test_infiniium(self):
+        from ivi.agilent import agilentDSA90254A
+        drv = agilentDSA90254A(simulate=True)
+        # transfers are always full records of words
+        drv.waveform.format = 'word'
+        drv.waveform.points_mode = 'normal'
+        drv.waveform.points = 0
+        for name, value in (('format', 'byte'), ('points_mode', 'raw'), ('points', 1000)):
+            self.assertRaises(ivi.ValueNotSupportedException, setattr, drv.waveform, name, value)
+        self.assertEqual(drv.waveform.format, 'word')
+
+class TestMinMax(unittest.TestCase):
+
+    def test_peak_detect(self):
+        from ivi.agilent import agilentMSO7104A
+        data = np.array([1, 3, 4, 2, 5, 9, 8, 7], dtype=np.uint16)
+        inst = VirtualInstrument({
+            'waveform:preamble?': b'1,1,8,1,1.0E-9,0,0,1.0,0,0',
+            'waveform:data?': ivi.build_ieee_block(data.tobytes())})
+        drv = agilentMSO7104A(inst)
+        self.assertRaises(scope.InvalidAcquisitionTypeException, drv.channels[0].measurement.fetch_waveform)
+        env = drv.channels[0].measurement.fetch_waveform_min_max()
+        self.assertEqual(env.y_min.tolist(), [1.0, 2.0, 5.0, 7.0])
+        self.assertEqual(env.y_max.tolist(), [3.0, 4.0, 9.0, 8.0])
+        self.assertAlmostEqual(env.x_increment, 2e-9)
+        env = drv.channels[0].measurement.fetch_waveform_min_max(2)
+        self.assertEqual(list(zip(env.y_min.tolist(), env.y_max.tolist())), [(1.0, 4.0), (5.0, 9.0)])
+
+    def test_infiniium(self):
+        from ivi.agilent import agilentDSA90254A
+        data = np.array([1, 3, 4, 2, 5, 9, 8, 7], dtype=np.int16)
+        responses = {
+            'acquire:mode?': b'RTIM',
+            'waveform:preamble?': b'2,1,8,1,1.0E-9,0,0,1.0,0,0',
+            'waveform:data?': ivi.build_ieee_block(data.tobytes())}
+        # type 1 is a raw record on the Infiniium
+        drv = agilentDSA90254A(VirtualInstrument(responses))
+        self.assertEqual(drv.channels[0].measurement.fetch_waveform().y.tolist(), data.tolist())
+        env = drv.channels[0].measurement.fetch_waveform_min_max(2)
+        self.assertEqual(list(zip(env.y_min.tolist(), env.y_max.tolist())), [(1.0, 4.0), (5.0, 9.0)])
+        # peak detect is rejected before the record is transferred
+        responses['acquire:mode?'] = b'PDET'
+        inst = VirtualInstrument(responses)
+        drv = agilentDSA90254A(inst)
+        self.assertRaises(scope.InvalidAcquisitionTypeException, drv.channels[0].measurement.fetch_waveform_min_max)
+        self.assertFalse(any(b'waveform:data?' in msg for msg in inst.rx_log))
+
+class TestWindow(unittest.TestCase):
+
+    def test_get_waveform_window(self):
+        self.assertEqual(scope.get_waveform_window(None, None, 'points', 0, 1, 10), (0, 10))
+        self.assertEqual(scope.get_waveform_window(2, -2, 'points', 0, 1, 10), (2, 8))
+        self.assertEqual(scope.get_waveform_window(8, 2, 'points', 0, 1, 10), (8, 8))
+        self.assertEqual(scope.get_waveform_window(-0.3e-6, 0.3e-6, 'time', -1e-6, 0.1e-6, 20), (7, 14))
+        self.assertEqual(scope.get_waveform_window(-5e-6, None, 'time', -1e-6, 0.1e-6, 20), (0, 20))
+        self.assertRaises(ivi.ValueNotSupportedException, scope.get_waveform_window, 0, 1, 'bins', 0, 1, 10)
+
+    def test_infiniivision(self):
+        from ivi.agilent import agilentMSO7104A
+        inst = VirtualInstrument({
+            'waveform:preamble?': b'1,0,10,1,1.0E-9,-5.0E-9,0,1.0,0,0',
+            'waveform:data?': ivi.build_ieee_block(np.arange(10, 20, dtype=np.uint16).tobytes())})
+        drv = agilentMSO7104A(inst)
+        # no start and size for :waveform:data?, the full record is sliced
+        wfm = drv.channels[0].measurement.fetch_waveform_window(2, 5)
+        self.assertEqual(inst.rx_log[-1], b':waveform:data?')
+        self.assertEqual(wfm.y.tolist(), [12.0, 13.0, 14.0])
+        self.assertAlmostEqual(wfm.x_origin, -3e-9)
+
+    def test_tektronix(self):
+        from ivi.tektronix import tektronixMSO4104
+        pre = ['0'] * 17
+        pre[6] = '1000'
+        pre[7] = 'Y'
+        pre[10] = '1.0E-9'
+        pre[11] = '-5.0E-7'
+        pre[14] = '1.0'
+        inst = VirtualInstrument({
+            'wfmoutpre?': ';'.join(pre).encode(),
+            'curve?': ivi.build_ieee_block(np.arange(10, 20, dtype=np.uint16).tobytes())})
+        drv = tektronixMSO4104(inst)
+        wfm = drv.channels[0].measurement.fetch_waveform_window(-5e-9, 4e-9, 'time')
+        self.assertEqual(inst.rx_log[-1], b':data:start 496;:data:stop 505;:curve?')
+        self.assertEqual(wfm.y.tolist(), list(range(10, 20)))
+        self.assertAlmostEqual(wfm.x_origin, -5e-9)
+
+    def test_tektronix_records(self):
+        from ivi.tektronix import tektronixMSO4104
+        pre = ['0'] * 17
+        pre[6] = '256'
+        pre[7] = 'Y'
+        pre[10] = '1.0E-9'
+        pre[14] = '1.0'
+        # 0x0a and ';' bytes inside the blocks, more data than one short read
+        data = np.arange(0x0a00, 0x0b00, dtype=np.uint16)
+        inst = ChunkedInstrument({
+            'wfmoutpre?': ';'.join(pre).encode(),
+            'curve?': b';'.join([ivi.build_ieee_block(data.tobytes())] * 2)}, 512)
+        drv = tektronixMSO4104(inst)
+        wfm = drv.measurement.fetch_waveforms([0, 1])
+        self.assertEqual(wfm.y.shape, (2, 256))
+        self.assertEqual(wfm.y[1].tolist(), data.astype(float).tolist())
+        self.assertEqual(inst.rx_log[-1], b':data:source ch1,ch2;:curve?')
+        self.assertEqual(inst.read_buffer.read(), b'')
+
+class TestArbitraryWaveform(unittest.TestCase):
+
+    def test_get_data(self):
+        from ivi import fgen
+        y = np.linspace(-1, 1, 8)
+        self.assertTrue(fgen.get_arbitrary_waveform_data(y)[1] is y)
+        self.assertEqual(fgen.get_arbitrary_waveform_data([0.5, 1])[1].tolist(), [0.5, 1.0])
+        self.assertTrue(np.shares_memory(fgen.get_arbitrary_waveform_data(y.reshape(-1, 1))[1], y))
+        # two samples in a tuple are not an (x, y) pair
+        self.assertRaises(ivi.ValueNotSupportedException, fgen.get_arbitrary_waveform_data, (0.5, 1.0))
+        self.assertRaises(ivi.ValueNotSupportedException, fgen.get_arbitrary_waveform_data, [(0, 1), (1,)])
+        x, y2 = fgen.get_arbitrary_waveform_data(np.vstack((y * 2, y)))
+        self.assertEqual((x.tolist(), y2.tolist()), ((y * 2).tolist(), y.tolist()))
+        x, y2 = fgen.get_arbitrary_waveform_data([(0, 0.5), (1, -0.5), (2, 0)])
+        self.assertEqual((x.tolist(), y2.tolist()), ([0, 1, 2], [0.5, -0.5, 0]))
+        x, y2 = fgen.get_arbitrary_waveform_data((range(8), y))
+        self.assertTrue(y2 is y)
+        self.assertRaises(ivi.ValueNotSupportedException, fgen.get_arbitrary_waveform_data, np.zeros((3, 3)))
+
+    def test_encode(self):
+        from ivi import fgen
+        y = [-2.0, -1.0, -0.5, 0.0, 0.3, 1.0, 1.5]
+        # reference: the per-sample encoding used by the drivers before
+        ref = b''.join(struct.pack('>H', int((min(max(f, -1), 1) + 1) / 2 * 4094 + 0.5)) for f in y)
+        self.assertEqual(fgen.encode_arbitrary_waveform(y, '>u2', 12), ref)
+        ref = b''.join(struct.pack('<f', min(max(f, -1), 1)) for f in y)
+        self.assertEqual(fgen.encode_arbitrary_waveform(np.array(y), '<f4'), ref)
+        self.assertEqual(np.frombuffer(fgen.encode_arbitrary_waveform(y, '<i2', 14), '<i2').tolist(),
+            [-8191, -8191, -4095, 0, 2457, 8191, 8191])
+        self.assertEqual(fgen.encode_arbitrary_waveform([1], '<u2'), b'\xfe\xff')
+
+    def test_cache(self):
+        from ivi import fgen
+        from ivi.tektronix import tektronixAWG2005
+        inst = VirtualInstrument({
+            'memory:catalog:all?': b':MEMORY:CATALOG:ALL "0badf00d.wfm","WFM",1024,"setup.set","SET",512',
+            '*esr?': b'0'})
+        drv = tektronixAWG2005(inst)
+        # waveforms from an earlier session have unknown content, they are not found by key
+        self.assertEqual(list(drv._arbitrary_waveform_cache.items()), [('0badf00d.wfm', '0badf00d.wfm')])
+        uploads = lambda: len([m for m in inst.rx_log if m.startswith(b':curve ')])
+        sine = np.sin(np.linspace(0, 2 * np.pi, 64))
+        key = drv._arbitrary_waveform_cache_key(fgen.encode_arbitrary_waveform(sine, '>u2', 12), "%e" % 1e-7)
+        # files are named after the key, the cache is keyed by all of it
+        h1 = drv.arbitrary.waveform.create(sine)
+        self.assertEqual(h1, key[:8] + '.wfm')
+        self.assertEqual(drv.arbitrary.waveform.create(list(sine)), h1)
+        self.assertEqual(uploads(), 1)
+        self.assertEqual(list(drv._arbitrary_waveform_cache)[-1], key)
+        # the sample interval is stored with the waveform
+        x = np.arange(64) * 1e-6
+        self.assertNotEqual(drv.arbitrary.waveform.create((x, sine)), h1)
+        self.assertEqual(uploads(), 2)
+        # least recently used waveforms make room, counting the whole catalog
+        drv._arbitrary_waveform_number_waveforms_max = 3
+        drv.arbitrary.waveform.create(sine)
+        h4 = drv.arbitrary.waveform.create(-sine)
+        self.assertEqual([m for m in inst.rx_log if m.startswith(b':memory:delete')],
+            [b':memory:delete "0badf00d.wfm"'])
+        self.assertEqual(list(drv._arbitrary_waveform_cache.values())[-2:], [h1, h4])
+        self.assertEqual(len(drv._arbitrary_waveform_cache), 3)
+        # the cache follows the instrument catalog
+        drv._load_catalog()
+        self.assertEqual(list(drv._arbitrary_waveform_cache.items()), [('0badf00d.wfm', '0badf00d.wfm')])
+
+    def test_cache_earlier_session(self):
+        from ivi import fgen
+        from ivi.tektronix import tektronixAWG2005
+        inst = VirtualInstrument({'memory:catalog:all?': b':MEMORY:CATALOG:ALL ', '*esr?': b'0'})
+        drv = tektronixAWG2005(inst)
+        sine = np.sin(np.linspace(0, 2 * np.pi, 64))
+        key = drv._arbitrary_waveform_cache_key(fgen.encode_arbitrary_waveform(sine, '>u2', 12), "%e" % 1e-7)
+        inst.responses['memory:catalog:all?'] = (':MEMORY:CATALOG:ALL "%s.wfm","WFM",1024' % key[:8]).encode()
+        inst.responses['wfmpre:nr_pt?'] = b':WFMPRE:NR_PT 64'
+        inst.responses['wfmpre:xincr?'] = b':WFMPRE:XINCR 1.0E-7'
+        drv._load_catalog()
+        # a matching file stored under the name is reused without an upload
+        self.assertEqual(drv.arbitrary.waveform.create(sine), key[:8] + '.wfm')
+        self.assertEqual([m for m in inst.rx_log if m.startswith(b':curve ')], [])
+        self.assertEqual(list(drv._arbitrary_waveform_cache.items()), [(key, key[:8] + '.wfm')])
+        # a different waveform under the name moves on to the next digits of the key
+        inst.responses['wfmpre:nr_pt?'] = b':WFMPRE:NR_PT 32'
+        drv._arbitrary_waveform_cache.clear()
+        drv._load_catalog()
+        self.assertEqual(drv.arbitrary.waveform.create(sine), key[8:16] + '.wfm')
+        self.assertEqual(len([m for m in inst.rx_log if m.startswith(b':curve ')]), 1)
+        self.assertEqual([m for m in inst.rx_log if m.startswith(b':memory:delete')], [])
+
+    def test_cache_memory_full(self):
+        from ivi import fgen
+        from ivi.tektronix import tektronixAWG2005
+        esr = [b'16', b'0']
+        evmsg = [b':EVMSG 225,"Out of memory"', b':EVMSG 0,"No events to report - queue empty"']
+        class Responses(dict):
+            def get(self, key, default=None):
+                if key == '*esr?':
+                    return esr.pop(0) if esr else b'16'
+                if key == 'evmsg?':
+                    return evmsg.pop(0) if evmsg else b':EVMSG 0,"No events to report - queue empty"'
+                return dict.get(self, key, default)
+        inst = VirtualInstrument(Responses({'memory:catalog:all?':
+            b':MEMORY:CATALOG:ALL "0badf00d.wfm","WFM",1024'}))
+        drv = tektronixAWG2005(inst)
+        sine = np.sin(np.linspace(0, 2 * np.pi, 64))
+        # the least recently used waveform is cleared and the upload repeated
+        h = drv.arbitrary.waveform.create(sine)
+        self.assertEqual(len([m for m in inst.rx_log if m.startswith(b':curve ')]), 2)
+        self.assertEqual([m for m in inst.rx_log if m.startswith(b':memory:delete')],
+            [b':memory:delete "0badf00d.wfm"'])
+        self.assertEqual(list(drv._arbitrary_waveform_cache.values()), [h])
+        # nothing left to clear once the only waveform is generated
+        evmsg[:] = [b':EVMSG 225,"Out of memory"', b':EVMSG 0,"No events to report - queue empty"']
+        drv._output_arbitrary_waveform[0] = h
+        self.assertRaises(fgen.NoWaveformsAvailableException, drv.arbitrary.waveform.create, -sine)
+        # other errors do not clear any waveforms
+        esr[:] = [b'16']
+        evmsg[:] = [b':EVMSG 222,"Data out of range"', b':EVMSG 0,"No events to report - queue empty"']
+        drv._output_arbitrary_waveform[0] = None
+        deletes = len([m for m in inst.rx_log if m.startswith(b':memory:delete')])
+        self.assertRaises(ivi.InstrumentStatusExcpetion, drv.arbitrary.waveform.create, -sine)
+        self.assertEqual(len([m for m in inst.rx_log if m.startswith(b':memory:delete')]), deletes)
+        self.assertEqual(list(drv._arbitrary_waveform_cache.values()), [h])
+
+class TestTrace(unittest.TestCase):
+
+    def test_agilent8590(self):
+        from ivi.agilent import agilent8590E
+        data = np.array([0, 4000, 8000, -800], dtype='>i2').tobytes()
+        inst = VirtualInstrument({'tra?': b'#A' + struct.pack('>H', len(data)) + data,
+            'fa?': b'1.0E+06', 'fb?': b'1.0E+09'})
+        drv = agilent8590E(inst)
+        drv._acquisition_vertical_scale = 'logarithmic'
+        drv._level_reference = 0.0
+        drv._set_cache_valid(True, 'acquisition_vertical_scale')
+        drv._set_cache_valid(True, 'level_reference')
+        y = drv.traces[0].fetch_y()
+        self.assertEqual(inst.rx_log[-1], b'tdf a;mds w;tra?')
+        self.assertTrue(isinstance(y, np.ndarray))
+        self.assertEqual(y.tolist(), [-80.0, -40.0, 0.0, -88.0])
+        x = drv.traces[0].fetch_x()
+        self.assertEqual((len(x), x[0], x[-1]), (401, 1e6, 1e9))
+
+    def test_agilent86140B(self):
+        from ivi.agilent import agilent86140B
+        data = np.array([-10.5, -70.25], dtype='>f4').tobytes()
+        inst = VirtualInstrument({'trace:data:y? tra': ivi.build_ieee_block(data),
+            'sense:wavelength:start?': b'1.5E-06', 'sense:wavelength:stop?': b'1.6E-06',
+            'sense:sweep:points?': b'+3'})
+        drv = agilent86140B(inst)
+        y = drv.traces[0].fetch_y()
+        self.assertEqual(inst.rx_log[-1], b'format:data real,32;:trace:data:y? tra')
+        self.assertEqual(y.tolist(), [-10.5, -70.25])
+        self.assertTrue(np.allclose(drv.traces[0].fetch_x(), [1.5e-6, 1.55e-6, 1.6e-6]))
+
+    def test_fetch_traces(self):
+        from ivi.agilent import agilent8590E, agilent86140B
+        words = lambda l: np.array(l, dtype='>i2').tobytes()
+        block = lambda d: b'#A' + struct.pack('>H', len(d)) + d
+        inst = VirtualInstrument({'tra?': block(words([0, 8000, 4000])),
+            'trc?': block(words([8000, 0, 4000]))})
+        drv = agilent8590E(inst)
+        drv._acquisition_vertical_scale = 'linear'
+        drv._level_reference = 2.0
+        drv._set_cache_valid(True, 'acquisition_vertical_scale')
+        drv._set_cache_valid(True, 'level_reference')
+        del inst.rx_log[:]
+        y = drv.acquisition.fetch_traces(['trace1', 2])
+        self.assertEqual(y.tolist(), [[0.0, 2.0, 1.0], [2.0, 0.0, 1.0]])
+        self.assertEqual(inst.rx_log, [b'tdf a;mds w;tra?', b'trc?'])
+        data = np.array([-10.5, -70.25], dtype='>f4').tobytes()
+        inst = VirtualInstrument({'trace:data:y? tra': ivi.build_ieee_block(data),
+            'trace:data:y? trc': ivi.build_ieee_block(data[4:] + data[:4])})
+        drv = agilent86140B(inst)
+        y = drv.acquisition.fetch_traces(['tra', 'trc'])
+        self.assertEqual(inst.rx_log[-1], b'format:data real,32;:trace:data:y? tra;:trace:data:y? trc')
+        self.assertEqual(y.tolist(), [[-10.5, -70.25], [-70.25, -10.5]])
+        self.assertEqual(drv.acquisition.fetch_traces([]).shape, (0, 0))
+        # by default only the traces that are switched on
+        for c in 'abcdef':
+            inst.responses['trace:state? tr' + c] = b'1' if c in 'ac' else b'0'
+        self.assertEqual(drv.acquisition.fetch_traces().tolist(), [[-10.5, -70.25], [-70.25, -10.5]])
+        self.assertEqual(inst.rx_log[-1], b'format:data real,32;:trace:data:y? tra;:trace:data:y? trc')
+        # traces of different lengths are not truncated
+        inst.responses['trace:data:y? trc'] = ivi.build_ieee_block(data[4:])
+        self.assertRaises(ivi.UnexpectedResponseException, drv.acquisition.fetch_traces)
+        self.assertRaises(ivi.UnexpectedResponseException, specan.stack_traces, [[1, 2], [1]])
+
+class TestMarker(unittest.TestCase):
+
+    def test_find_peaks(self):
+        y = np.array([0, 5, 1, 10, 9, 10.5, 0, 3, 3, 0, 0])
+        self.assertEqual(specan.find_peaks(y).tolist(), [1, 3, 5, 7])
+        # the shoulder at 3 does not fall far enough before the higher peak
+        self.assertEqual(specan.find_peaks(y, 2).tolist(), [1, 5, 7])
+        self.assertEqual(specan.find_peaks(y, 4).tolist(), [1, 5])
+        self.assertEqual(specan.find_peaks(y, 0, 4).tolist(), [1, 3, 5])
+        self.assertEqual(specan.find_peaks(np.zeros(5)).tolist(), [])
+        self.assertEqual(specan.find_peaks([]).tolist(), [])
+
+    def test_band_power(self):
+        x = np.arange(5) * 1e3
+        y = np.array([-100, 0, 0, -100, -100])
+        self.assertAlmostEqual(specan.band_power(y, x, 1e3, 2e3), 10 * np.log10(2))
+        self.assertAlmostEqual(specan.band_power(y, x, 0, 4e3, 2e3), 0, 6)
+        self.assertEqual(specan.band_power(y, x, 10e3, 20e3), -np.inf)
+
+    def test_trace(self):
+        x = np.arange(11) * 1e6
+        t = specan.Trace(x, [0, 5, 1, 10, 9, 10.5, 0, 3, 3, 0, 0])
+        self.assertEqual(t.highest_peaks(2).tolist(), [5, 3])
+        self.assertEqual(t.search(), 5)
+        self.assertEqual(t.search('minimum'), 0)
+        self.assertEqual(t.search('next_peak', 5), 3)
+        self.assertEqual(t.search('next_peak_left', 3), 1)
+        self.assertEqual(t.search('next_peak_right', 5), 7)
+        self.assertEqual(t.search('next_peak_right', 7), None)
+        t.peak_excursion = 2
+        self.assertEqual(t.search('next_peak', 5), 1)
+        self.assertEqual(t.delta(1, 5), (-4e6, -5.5))
+        self.assertRaises(ivi.ValueNotSupportedException, t.search, 'lowest')
+
+    def test_fetch_trace(self):
+        from ivi.agilent import agilent8590E
+        data = np.array([0, 8000, 0, 4000], dtype='>i2').tobytes()
+        inst = VirtualInstrument({'tra?': b'#A' + struct.pack('>H', len(data)) + data,
+            'fa?': b'1.0E+06', 'fb?': b'4.0E+06', 'lg?': b'10', 'rl?': b'0'})
+        drv = agilent8590E(inst)
+        t = drv.traces[0].fetch_trace()
+        self.assertEqual(t.x.tolist(), [1e6, 2e6, 3e6, 4e6])
+        n = len(inst.rx_log)
+        self.assertEqual(t.x[t.search()], 2e6)
+        self.assertEqual(t.search('next_peak', 1), None)
+        self.assertEqual(len(inst.rx_log), n)
+
+class TestLazyImport(unittest.TestCase):
+
+    def get_modules(self, stmt):
+        # run in a fresh interpreter so that modules loaded by other tests do not interfere
+        path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        code = "import sys; sys.path.insert(0, %r); %s; print(' '.join(sys.modules))" % (path, stmt)
+        out = subprocess.check_output([sys.executable, '-c', code])
+        return set(m for m in out.decode().split() if m.startswith('ivi.'))
+
+    def test_import_ivi(self):
+        mods = self.get_modules("import ivi")
+        self.assertEqual(mods - set(['ivi.ivi', 'ivi.version', 'ivi.interface']), set())
+
+    def test_import_driver(self):
+        mods = self.get_modules("import ivi; ivi.agilent.agilentDSOX3034A")
+        self.assertTrue('ivi.agilent.agilentDSOX3034A' in mods)
+        self.assertTrue('ivi.agilent.agilentBaseScope' in mods)
+        self.assertFalse('ivi.agilent.agilentDSOX3024A' in mods)
+        self.assertFalse('ivi.agilent.agilent8590A' in mods)
+        self.assertFalse('ivi.tektronix' in mods)
+
+    def test_driver_binding(self):
+        from ivi.agilent import agilent34461A
+        self.assertTrue(isinstance(ivi.agilent.agilent34401A, type))
+        self.assertTrue(issubclass(agilent34461A, ivi.agilent.agilent34401A))
+        self.assertTrue('agilent8590A' in dir(ivi.agilent))
+        self.assertRaises(AttributeError, getattr, ivi.agilent, 'agilentBogus')
+
 if __name__ == '__main__':
     unittest.main()
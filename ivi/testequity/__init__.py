@@ -24,10 +24,10 @@ THE SOFTWARE.
 
 """
 
-# Enviromental Chambers
-from .testequityf4 import testequityf4
-from .testequity140 import testequity140
-
-
-
+__all__ = [
+        # Enviromental Chambers
+        "testequityf4",
+        "testequity140"]
 
+from .. import ivi
+ivi.lazy_import(__name__, drivers=__all__)